@@ -1,3 +1,4 @@
+import os
 import sys
 from pathlib import Path
 
@@ -9,9 +10,14 @@ import uvicorn
 from src.main import app
 
 if __name__ == "__main__":
+    # 热重载仅在开发模式下通过环境变量开启，与多进程模式互斥
+    reload = os.getenv("UVICORN_RELOAD", "false").lower() == "true"
     uvicorn.run(
         "src.main:app",  # 使用模块路径
         host="0.0.0.0",
         port=8000,
-        reload=True  # 开发模式下启用热重载
-    ) 
\ No newline at end of file
+        loop="uvloop",  # 基于libuv的事件循环
+        http="httptools",  # C实现的HTTP解析器
+        reload=reload,
+        workers=None if reload else int(os.getenv("WEB_CONCURRENCY", "2"))
+    )
@@ -1,66 +1,275 @@
-from typing import List, Dict, Optional, Any, Callable
+from typing import List, Dict, Optional, Any, Callable, Awaitable
 from .graph.chat import ChatGraph
-from .prompt_template import PromptTemplate
+from .dedup import dedup_messages
+from .memory import ChatMemory
+from .response_cache import file_fingerprints
+from .semantic_cache import semantic_cache
+from .zhipu_api import TruncatedResponseError
+from src.config.settings import settings
 from src.logger.logger import logger
 from src.utils.decorators import handle_exceptions
-from src.utils.common import safe_json_loads
-from src.utils.plantuml_generator import PlantUMLGenerator
-from langchain_core.chat_history import BaseChatMessageHistory
-from langchain_core.messages import HumanMessage, AIMessage, SystemMessage
-from langchain_core.memory import BaseMemory
-from langchain_community.chat_message_histories import ChatMessageHistory
-from pydantic import Field
-import json
+from src.utils.common import safe_orjson_loads, extract_json_block
+from src.utils.plantuml_generator import get_plantuml_generator
+import orjson
 import asyncio
+import itertools
+import bisect
+import os
+import random
+import httpx
 from .graph.base import BaseGraph
 
-class ChatMemory(BaseMemory):
-    """自定义聊天记忆管理"""
-    
-    chat_history: BaseChatMessageHistory = Field(default_factory=ChatMessageHistory)
-    return_messages: bool = Field(default=True)
-    
-    def clear(self) -> None:
-        """清除历史记忆"""
-        self.chat_history.clear()
-    
-    @property
-    def memory_variables(self) -> List[str]:
-        """获取记忆变量列表"""
-        return ["chat_history"]
+# 预热JSON编解码器，避免首个请求承担初始化开销
+orjson.loads(orjson.dumps({"warmup": None}))
+
+# 需求分析系统提示词
+REQUIREMENT_ANALYSIS_SYSTEM_MESSAGE = {
+    "role": "system",
+    "content": (
+        "你是一个专业的需求分析专家。请仔细分析需求文档中的图片，提取关键信息并生成结构化的分析结果。\n"
+        "分析要点和返回格式要求：\n"
+        "{\n"
+        "  \"需求背景\": {\n"
+        "    \"项目背景\": \"项目的具体业务场景和目标\",\n"
+        "    \"业务目标\": [\"目标1\", \"目标2\"],\n"
+        "    \"主要痛点\": [\"痛点1\", \"痛点2\"],\n"
+        "    \"解决方案\": \"具体的解决方案\"\n"
+        "  },\n"
+        "  \"整体功能架构\": {\n"
+        "    \"系统模块\": [\"模块1\", \"模块2\"],\n"
+        "    \"功能结构\": [\"功能1\", \"功能2\"],\n"
+        "    \"核心功能\": [\"功能1\", \"功能2\"],\n"
+        "    \"辅助功能\": [\"功能1\", \"功能2\"]\n"
+        "  },\n"
+        "  \"核心业务流程\": {\n"
+        "    \"业务场景\": [\"场景1\", \"场景2\"],\n"
+        "    \"操作步骤\": [\"步骤1\", \"步骤2\"],\n"
+        "    \"业务规则\": [\"规则1\", \"规则2\"],\n"
+        "    \"处理逻辑\": [\"逻辑1\", \"逻辑2\"]\n"
+        "  },\n"
+        "  \"系统交互关系\": {\n"
+        "    \"交互流程\": [\"流程1\", \"流程2\"],\n"
+        "    \"模块调用\": [\"调用1\", \"调用2\"],\n"
+        "    \"数据传递\": [\"数据流1\", \"数据流2\"],\n"
+        "    \"接口依赖\": [\"依赖1\", \"依赖2\"]\n"
+        "  }\n"
+        "}\n\n"
+        "注意事项：\n"
+        "1. 必须基于图片内容进行分析，不要使用通用模板\n"
+        "2. 确保返回完整的 JSON 格式\n"
+        "3. 字段名称必须与示例格式完全一致\n"
+        "4. 分析要全面但简洁，避免冗长"
+    )
+}
+
+# 测试用例生成系统提示词
+TESTCASE_SYSTEM_TEMPLATE = "你是测试专家，请专注于{batch_type}相关的测试用例生成。"
+
+# 多图片分析总结系统提示词
+REQUIREMENT_SUMMARY_SYSTEM_MESSAGE = {
+    "role": "system",
+    "content": (
+        "你是一个专业的需求分析专家。请对多张需求图片的分析结果进行总结。\n"
+        "要求：\n"
+        "1. 合并相同或相似的功能点\n"
+        "2. 解决可能的冲突点\n"
+        "3. 保持关键信息的完整性\n"
+        "4. 确保返回完整的JSON格式\n"
+        "5. 控制返回内容的大小，避免过于冗长"
+    )
+}
+
+# 需求批次分析系统提示词
+REQUIREMENT_BATCH_SYSTEM_TEMPLATE = (
+    "你是一个专业的测试用例设计专家。现请专注分析需求中的{batch_type}部分。"
+    "请结合之前的上下文，确保分析的连续性和完整性。"
+    "返回格式应为JSON对象。"
+)
+
+# 测试用例生成提示词
+TESTCASE_PROMPT_TEMPLATE = (
+    "请基于下{batch_type}信息生成测试用例：\n\n"
+    "{data}\n\n"
+    "要求：\n"
+    "1. 重点关注{focus}\n"
+    "2. 包含正向流程和异常场景\n"
+    "3. 每个功能点生成2-3个用例\n"
+    "4. 测试用例格式：\n"
+    "{{\n"
+    "  \"testcases\": [{{\n"
+    "    \"id\": \"TC_001\",\n"
+    "    \"module\": \"模块名\",\n"
+    "    \"name\": \"用例名称\",\n"
+    "    \"level\": \"P0-P3\",\n"
+    "    \"precondition\": \"前置条件\",\n"
+    "    \"steps\": [\"步骤1\", \"步骤2\"],\n"
+    "    \"expected\": [\"预期1\", \"预期2\"],\n"
+    "    \"actual\": \"\",\n"
+    "    \"status\": \"\",\n"
+    "    \"remark\": \"\"\n"
+    "  }}]\n"
+    "}}"
+)
+
+# 需求分析必要字段
+REQUIRED_REQUIREMENT_FIELDS = frozenset(('整体功能架构', '核心业务流程', '系统交互关系'))
+REQUIRED_REQUIREMENT_FIELDS_WITH_BACKGROUND = REQUIRED_REQUIREMENT_FIELDS | {'需求背景'}
+
+# 测试用例必填字段
+REQUIRED_TESTCASE_FIELDS = frozenset(
+    ('id', 'module', 'name', 'level', 'precondition', 'steps', 'expected')
+)
+
+# 可重试的异常类型（网络抖动、超时、响应被截断等暂时性错误）
+RETRIABLE_EXCEPTIONS = (asyncio.TimeoutError, ConnectionError, httpx.TransportError, TruncatedResponseError)
+
+# 可重试的HTTP状态码（限流），5xx服务端错误另行判断
+RETRIABLE_STATUS_CODES = frozenset((429,))
+
+
+def _is_retriable(error: BaseException) -> bool:
+    """判断异常是否为可重试的暂时性错误
     
-    def load_memory_variables(self, inputs: Dict[str, Any]) -> Dict[str, Any]:
-        """加载记忆变量
+    Args:
+        error: 捕获的异常
         
-        Args:
-            inputs: 输入参数
-            
-        Returns:
-            Dict[str, Any]: 包含历史记忆的字典
-        """
-        if self.return_messages:
-            return {"chat_history": self.chat_history.messages}
+    Returns:
+        bool: 是否可重试
+    """
+    if isinstance(error, RETRIABLE_EXCEPTIONS):
+        return True
+    if isinstance(error, httpx.HTTPStatusError):
+        status_code = error.response.status_code
+        return status_code in RETRIABLE_STATUS_CODES or status_code >= 500
+    return False
+
+
+def _backoff_delay(attempt: int, base: float = 0.5, cap: float = 30) -> float:
+    """计算带随机抖动的指数退避时间
+    
+    Args:
+        attempt: 当前尝试序号（从0开始）
+        base: 初始延迟(秒)
+        cap: 最大延迟(秒)
         
-        return {"chat_history": self._get_chat_string()}
+    Returns:
+        float: 等待时间(秒)
+    """
+    return min(cap, base * (2 ** attempt)) + random.random() * 0.25
+
+
+def _estimate_tokens(text: str) -> int:
+    """粗略估算文本的token数（中文约每字一个token，按字符数保守估计）"""
+    return len(text) if isinstance(text, str) else 0
+
+
+def _is_requirement_response(response: str) -> bool:
+    """判断需求分析响应是否可用（JSON对象或以对象开头的非空列表），用于缓存写入前的校验"""
+    try:
+        result = orjson.loads(extract_json_block(response) or response)
+    except orjson.JSONDecodeError:
+        return False
+    if isinstance(result, list):
+        result = result[0] if result else None
+    return isinstance(result, dict) and bool(result)
+
+
+def _is_testcase_response(response: str) -> bool:
+    """判断测试用例响应是否可用（包含testcases列表的JSON对象），用于缓存写入前的校验"""
+    try:
+        result = orjson.loads(response)
+    except orjson.JSONDecodeError:
+        return False
+    return isinstance(result, dict) and isinstance(result.get("testcases"), list)
+
+
+# 图片按大小分组的组数
+IMAGE_SIZE_BINS = 3
+
+
+def _bin_by_size(sizes: List[int], bins: int = IMAGE_SIZE_BINS) -> List[List[int]]:
+    """按大小将元素分组，使同一组内的请求开销相近
     
-    def save_context(self, inputs: Dict[str, Any], outputs: Dict[str, Any]) -> None:
-        """保存上下文
+    Args:
+        sizes: 各元素的大小
+        bins: 分组数
         
-        Args:
-            inputs: 输入内容
-            outputs: 输出内容
-        """
-        input_str = inputs.get("input", "")
-        output_str = outputs.get("output", "")
+    Returns:
+        List[List[int]]: 从小到大排列的各组元素下标
+    """
+    if not sizes:
+        return []
+    largest = max(sizes) or 1
+    boundaries = [largest * i / bins for i in range(1, bins)]
+    groups: List[List[int]] = [[] for _ in range(bins)]
+    for index, size in enumerate(sizes):
+        groups[bisect.bisect_left(boundaries, size)].append(index)
+    return [group for group in groups if group]
+
+
+def _merge_analysis_results(results: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """在本地合并多张图片的需求分析结果
+    
+    各部分的列表字段按顺序合并去重，文本字段只在各结果一致（或为空）时直接采用。
+    文本字段内容不同、结果结构不一致（部分不是字典、字段类型不同或列表元素不可哈希）
+    时返回None，由调用方改用模型汇总。
+    
+    Args:
+        results: 各图片的分析结果
         
-        self.chat_history.add_message(HumanMessage(content=input_str))
-        self.chat_history.add_message(AIMessage(content=output_str))
+    Returns:
+        Optional[Dict[str, Any]]: 合并结果
+    """
+    merged: Dict[str, Dict[str, Any]] = {}
+    for result in results:
+        for section, fields in result.items():
+            if not isinstance(fields, dict):
+                return None
+            target = merged.setdefault(section, {})
+            for name, value in fields.items():
+                current = target.get(name)
+                if isinstance(value, list):
+                    if current is None:
+                        target[name] = current = []
+                    elif not isinstance(current, list):
+                        return None
+                    current.extend(value)
+                elif isinstance(value, str):
+                    if current is None or current == "":
+                        target[name] = value
+                    elif not isinstance(current, str):
+                        return None
+                    elif value and value != current:
+                        # 文本描述不同，需由模型归纳而不是简单拼接
+                        return None
+                else:
+                    return None
     
-    def _get_chat_string(self) -> str:
-        """获取聊天历史字符串"""
-        return "\n".join(
-            [f"{msg.type}: {msg.content}" for msg in self.chat_history.messages]
-        )
+    try:
+        return {
+            section: {
+                name: list(dict.fromkeys(values)) if isinstance(values, list) else values
+                for name, values in fields.items()
+            }
+            for section, fields in merged.items()
+        }
+    except TypeError:
+        # 列表元素不可哈希（如嵌套对象）
+        return None
+
+
+def _serialize_result(result: Dict[str, Any]) -> bytes:
+    """序列化分析结果（键有序，相同内容的结果序列化结果相同）"""
+    return orjson.dumps(result, option=orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS)
+
+
+def _file_size(path: str) -> int:
+    """获取文件大小，文件不可访问时返回0"""
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
 
 class ChatManager:
     """AI对话管理器"""
@@ -72,8 +281,128 @@ class ChatManager:
         
         # 初始化其他组件
         self.chat_graph = ChatGraph()
-        self.template = PromptTemplate()
+        self.ai = self.chat_graph.ai
+        self.template = self.chat_graph.template  # 复用已加载的模板及其缓存
         self.memory = ChatMemory()
+        
+        # 限制并发的批次请求数，避免超出接口QPS限制
+        self._batch_semaphore = asyncio.Semaphore(settings.ai.AI_MAX_CONCURRENCY)
+        
+        # 对话历史，在 history_min 到 history_max 之间只追加不截断，
+        # 保证每轮请求的前缀不变，以命中服务端的提示词缓存
+        self.history_min = 10
+        self.history_max = 20
+        self.history: List[Dict[str, str]] = []
+        # 历史消息的估算token总数，超出预算时从最早的消息开始淘汰
+        self.history_token_budget = settings.ai.AI_HISTORY_MAX_TOKENS
+        self._history_tokens = 0
+
+    def add_message(self, role: str, content: str) -> None:
+        """添加消息到对话历史
+        
+        Args:
+            role: 消息角色
+            content: 消息内容
+        """
+        self.history.append({"role": role, "content": content})
+        self._history_tokens += _estimate_tokens(content)
+        # 达到上限时一次性截断到最小窗口
+        if len(self.history) >= self.history_max:
+            self._drop_oldest_history(len(self.history) - self.history_min)
+        # 超出token预算时按轮次淘汰最早的对话，至少保留最新一条消息
+        while self._history_tokens > self.history_token_budget and self._drop_oldest_history(2):
+            pass
+    
+    def _drop_oldest_history(self, count: int) -> int:
+        """移除最早的若干条历史消息，保留开头的系统消息和最新一条消息
+        
+        Args:
+            count: 要移除的消息数
+            
+        Returns:
+            int: 实际移除的消息数
+        """
+        start = 1 if self.history and self.history[0]["role"] == "system" else 0
+        count = min(count, len(self.history) - start - 1)
+        if count <= 0:
+            return 0
+        removed = self.history[start:start + count]
+        del self.history[start:start + count]
+        self._history_tokens -= sum(_estimate_tokens(msg["content"]) for msg in removed)
+        return count
+
+    async def _chat_with_semantic_cache(
+        self,
+        message: str,
+        messages: List[Dict[str, Any]],
+        **context: Any
+    ) -> Optional[str]:
+        """发送对话请求，当前上下文下语义相近的问题直接返回缓存的回复
+        
+        先查询语义缓存，只有未命中或向量请求失败时才发送对话请求。
+        
+        Args:
+            message: 用户消息
+            messages: 完整的请求消息列表
+            **context: 影响回复内容的其他上下文（如图片指纹）
+            
+        Returns:
+            Optional[str]: 响应内容
+        """
+        if not settings.ai.AI_SEMANTIC_CACHE_ENABLED:
+            return await self.chat_graph.chat(messages)
+        
+        context_key = semantic_cache.make_context_key(self.history, **context)
+        embedding = await self.ai.embed(message)
+        if embedding is not None:
+            cached = semantic_cache.get(context_key, embedding)
+            if cached is not None:
+                logger.info("命中语义缓存")
+                return cached
+        
+        response = await self.chat_graph.chat(messages)
+        if response and embedding is not None:
+            semantic_cache.set(context_key, embedding, response)
+        return response
+
+    async def chat(self, message: str) -> Optional[str]:
+        """发送单轮对话
+        
+        Args:
+            message: 用户消息
+            
+        Returns:
+            Optional[str]: 响应内容
+        """
+        messages = [*self.history, {"role": "user", "content": message}]
+        response = await self._chat_with_semantic_cache(message, messages)
+        if response:
+            self.add_message("user", message)
+            self.add_message("assistant", response)
+        return response
+
+    async def chat_with_images(self, message: str, image_paths: List[str]) -> Optional[str]:
+        """发送带图片的对话
+        
+        Args:
+            message: 用户消息
+            image_paths: 图片路径列表
+            
+        Returns:
+            Optional[str]: 响应内容
+        """
+        messages = [*self.history, {
+            "role": "user",
+            "content": message,
+            "images": image_paths
+        }]
+        response = await self._chat_with_semantic_cache(
+            message, messages, files=file_fingerprints(image_paths)
+        )
+        if response:
+            self.add_message("user", message)
+            self.add_message("assistant", response)
+        return response
 
     @handle_exceptions(default_return=None)
     async def analyze_requirement(
@@ -99,7 +428,8 @@ class ChatManager:
             self.memory.clear()
             
             # 生成提示词
-            prompt = self.template.render(
+            prompt = await asyncio.to_thread(
+                self.template.render,
                 template_name="requirement_analysis",
                 content=content
             )
@@ -107,232 +437,25 @@ class ChatManager:
                 logger.error("生成需求分析提示词失败")
                 return None
             
-            logger.debug(f"生成的提示词:\n{prompt}")
+            logger.debug("生成的提示词:\n{}", prompt)
             
-            # 构建消息
-            messages = [{
-                "role": "system",
-                "content": (
-                    "你是一个专业的需求分析专家。请仔细分析需求文档中的图片，提取关键信息并生成结构化的分析结果。\n"
-                    "分析要点和返回格式要求：\n"
-                    "{\n"
-                    "  \"需求背景\": {\n"
-                    "    \"项目背景\": \"项目的具体业务场景和目标\",\n"
-                    "    \"业务目标\": [\"目标1\", \"目标2\"],\n"
-                    "    \"主要痛点\": [\"痛点1\", \"痛点2\"],\n"
-                    "    \"解决方案\": \"具体的解决方案\"\n"
-                    "  },\n"
-                    "  \"整体功能架构\": {\n"
-                    "    \"系统模块\": [\"模块1\", \"模块2\"],\n"
-                    "    \"功能结构\": [\"功能1\", \"功能2\"],\n"
-                    "    \"核心功能\": [\"功能1\", \"功能2\"],\n"
-                    "    \"辅助功能\": [\"功能1\", \"功能2\"]\n"
-                    "  },\n"
-                    "  \"核心业务流程\": {\n"
-                    "    \"业务场景\": [\"场景1\", \"场景2\"],\n"
-                    "    \"操作步骤\": [\"步骤1\", \"步骤2\"],\n"
-                    "    \"业务规则\": [\"规则1\", \"规则2\"],\n"
-                    "    \"处理逻辑\": [\"逻辑1\", \"逻辑2\"]\n"
-                    "  },\n"
-                    "  \"系统交互关系\": {\n"
-                    "    \"交互流程\": [\"流程1\", \"流程2\"],\n"
-                    "    \"模块调用\": [\"调用1\", \"调用2\"],\n"
-                    "    \"数据传递\": [\"数据流1\", \"数据流2\"],\n"
-                    "    \"接口依赖\": [\"依赖1\", \"依赖2\"]\n"
-                    "  }\n"
-                    "}\n\n"
-                    "注意事项：\n"
-                    "1. 必须基于图片内容进行分析，不要使用通用模板\n"
-                    "2. 确保返回完整的 JSON 格式\n"
-                    "3. 字段名称必须与示例格式完全一致\n"
-                    "4. 分析要全面但简洁，避免冗长"
+            # 多张图片逐张并发分析后汇总，否则直接分析
+            if image_paths and len(image_paths) > 1:
+                normalized_result = await self._analyze_images(prompt, image_paths, progress_callback)
+            else:
+                normalized_result = await self._request_requirement_analysis(
+                    prompt, image_paths, progress_callback
                 )
-            }]
-            
-            # 添加用户消息
-            messages.append({
-                "role": "user",
-                "content": prompt,
-                **({"images": image_paths} if image_paths else {})
-            })
-            
-            logger.debug(f"发送消息到AI:\n{json.dumps(messages, ensure_ascii=False, indent=2)}")
-            
-            # 使用新的chat_graph发送请求
-            response = None
-            result = None
-            max_retries = 3
-            
-            for attempt in range(max_retries):
-                try:
-                    # 更新进度
-                    if progress_callback:
-                        await progress_callback(attempt + 1, max_retries)
-                        
-                    response = await (
-                        self.chat_graph.chat(
-                            messages=messages,
-                            response_format={"type": "json_object"},
-                            timeout=180,  # 3分钟超时
-                            metadata={
-                                "task_type": "requirement_analysis",
-                                "attempt": attempt + 1,
-                                "max_retries": max_retries,
-                                "image_count": len(image_paths) if image_paths else 0
-                            }
-                        )
-                    )
-                    
-                    if not response:
-                        logger.warning(f"第{attempt + 1}次尝试未收到响应")
-                        continue
-                        
-                    # 尝试提取JSON内容
-                    if "```json" in response:
-                        import re
-                        json_match = re.search(r'```json\s*(\{.*?\})\s*```', response, re.DOTALL)
-                        if json_match:
-                            response = json_match.group(1)
-                    
-                    # 尝试解析JSON
-                    result = safe_json_loads(response)
-                    if result:
-                        logger.info(f"第{attempt + 1}次尝试成功解析响应")
-                        break
-                    
-                    logger.warning(f"第{attempt + 1}次尝试解析JSON失败")
-                    
-                except Exception as e:
-                    logger.error(f"第{attempt + 1}次尝试失败: {str(e)}")
-                    if attempt < max_retries - 1:
-                        await asyncio.sleep(2)  # 等待2秒后重试
-                    continue
             
-            if not response or not result:
+            if not normalized_result:
                 logger.error("需求分析失败：未能获取有效响应")
                 return None
             
-            logger.debug(f"收到AI响应:\n{response[:200]}...")
-            
-            # 检查结果格式并转换
-            if isinstance(result, list):
-                logger.debug("收到列表格式的响应，将合并结果")
-                if not result:
-                    logger.error("需求分析失败：响应列表为空")
-                    return None
-                # 使用第一个结果作为基础
-                result = result[0]
-            
-            # 检查结果格式
-            if not isinstance(result, dict):
-                logger.error(f"需求分析失败：响应不是字典类型 - {type(result)}")
-                return None
-            
-            # 处理可能的包装字段
-            if "report" in result:
-                result = result["report"]
-                logger.debug("从 report 字段中提取结果")
-            elif "answer" in result:
-                result = result["answer"]
-                logger.debug("从 answer 字段中提取结果")
-            elif "需求分析报告" in result:
-                result = result["需求分析报告"]
-                logger.debug("从 需求分析报告 字段中提取结果")
-            
-            # 标准化字段名称（移除序号前缀）
-            normalized_result = {}
-            for key, value in result.items():
-                # 移除可能的序号前缀（如 "1. "）
-                clean_key = key.split(". ")[-1] if ". " in key else key
-                normalized_result[clean_key] = value
-            
-            logger.debug(f"标准化后的结果:\n{json.dumps(normalized_result, ensure_ascii=False, indent=2)}")
-            
-            # 检查必要字段
-            required_fields = ['整体功能架构', '核心业务流程', '系统交互关系']
-            if image_paths:
-                required_fields.append('需求背景')  # 移除关联信息的强制要求
-            
-            missing_fields = [field for field in required_fields if field not in normalized_result]
-            if missing_fields:
-                # 如果缺少字段，尝试从原始响应中提取更多信息
-                for key in result.keys():
-                    clean_key = key.split(". ")[-1] if ". " in key else key
-                    # 检查是否有相似的字段名
-                    for required_field in missing_fields[:]:
-                        if (required_field in clean_key.lower() or 
-                            clean_key.lower() in required_field.lower()):
-                            normalized_result[required_field] = result[key]
-                            missing_fields.remove(required_field)
-                
-                # 再次检查是否还有缺失字段
-                if missing_fields:
-                    logger.warning(f"需求分析缺少字段 - {missing_fields}，但将继续处理")
-            
-            # 如果是多图片分析，进行汇总
-            if image_paths and len(image_paths) > 1:
-                logger.info("开始生成多图片分析总结")
-                summary_prompt = self.template.render(
-                    "requirement_batch_summary",
-                    content=json.dumps(normalized_result, ensure_ascii=False)
-                )
-                
-                if summary_prompt:
-                    try:
-                        # 构建总结消息
-                        summary_messages = [{
-                            "role": "system",
-                            "content": (
-                                "你是一个专业的需求分析专家。请对多张需求图片的分析结果进行总结。\n"
-                                "要求：\n"
-                                "1. 合并相同或相似的功能点\n"
-                                "2. 解决可能的冲突点\n"
-                                "3. 保持关键信息的完整性\n"
-                                "4. 确保返回完整的JSON格式\n"
-                                "5. 控制返回内容的大小，避免过于冗长"
-                            )
-                        }, {
-                            "role": "user",
-                            "content": summary_prompt
-                        }]
-                        
-                        # 使用chat_graph生成总结
-                        logger.info("使用chat_graph生成总结")
-                        summary_response = await self.chat_graph.chat(
-                            messages=summary_messages,
-                            response_format={"type": "json_object"},
-                            timeout=180,  # 3分钟超时
-                            metadata={
-                                "task_type": "testcase_summary",
-                                "project_name": project_name,
-                                "has_details": bool(details)
-                            }
-                        )
-                        
-                        if summary_response:
-                            summary_result = safe_json_loads(summary_response)
-                            if summary_result and isinstance(summary_result, dict):
-                                logger.info("成功生成多图片分析总结")
-                                # 保留原始分析中的某些字段
-                                for key in ['需求背景', '关联信息']:
-                                    if key in normalized_result and key not in summary_result:
-                                        summary_result[key] = normalized_result[key]
-                                normalized_result = summary_result
-                                logger.debug(f"总结果:\n{json.dumps(summary_result, ensure_ascii=False, indent=2)}")
-                            else:
-                                logger.warning("总结结果解析失败，将使用原始分析结果")
-                                logger.debug(f"无效的总结响应:\n{summary_response[:200]}...")
-                        else:
-                            logger.warning("未收到总结响应，将使用原始分析结果")
-                            
-                    except Exception as e:
-                        logger.error(f"生成总结时出错: {str(e)}")
-                        logger.warning("将使用原始分析结果")
-            
             # 更新记忆
+            output = orjson.dumps(normalized_result, option=orjson.OPT_NON_STR_KEYS).decode()
             self.memory.save_context(
                 {"input": prompt},
-                {"output": json.dumps(normalized_result, ensure_ascii=False)}
+                {"output": output}
             )
             
             logger.info("需求分析完成")
@@ -342,6 +465,304 @@ class ChatManager:
             logger.error(f"需求分析失败: {str(e)}", exc_info=True)
             return None
     
+    async def _request_requirement_analysis(
+        self,
+        prompt: str,
+        image_paths: Optional[List[str]] = None,
+        progress_callback: Optional[Callable[[int, int], None]] = None
+    ) -> Optional[Dict[str, Any]]:
+        """发送需求分析请求并标准化结果
+        
+        Args:
+            prompt: 需求分析提示词
+            image_paths: 图片路径列表
+            progress_callback: 进度回调函数，参数为(当前尝试次数, 最大尝试次数)
+            
+        Returns:
+            Optional[Dict[str, Any]]: 标准化后的分析结果
+        """
+        # 构建消息
+        messages = [REQUIREMENT_ANALYSIS_SYSTEM_MESSAGE]
+        
+        # 添加用户消息
+        messages.append({
+            "role": "user",
+            "content": prompt,
+            **({"images": image_paths} if image_paths else {})
+        })
+        
+        logger.opt(lazy=True).debug("发送消息到AI:\n{}", lambda: orjson.dumps(messages, option=orjson.OPT_NON_STR_KEYS).decode())
+        
+        # 使用新的chat_graph发送请求
+        response = None
+        result = None
+        max_retries = 3
+        
+        for attempt in range(max_retries):
+            # 更新进度
+            if progress_callback:
+                await progress_callback(attempt + 1, max_retries)
+            
+            # ChatGraph.chat内部捕获全部异常并返回None，请求失败统一按未收到响应重试
+            response = await self.chat_graph.chat(
+                messages=messages,
+                response_format={"type": "json_object"},
+                timeout=180,  # 3分钟超时
+                metadata={
+                    "task_type": "requirement_analysis",
+                    "attempt": attempt + 1,
+                    "max_retries": max_retries,
+                    "image_count": len(image_paths) if image_paths else 0
+                },
+                use_cache=True,
+                validate=_is_requirement_response
+            )
+            
+            if not response:
+                logger.warning(f"第{attempt + 1}次尝试未收到响应")
+                if attempt < max_retries - 1:
+                    await asyncio.sleep(_backoff_delay(attempt))
+                continue
+                
+            # 尝试提取JSON内容
+            response = extract_json_block(response) or response
+            
+            # 尝试解析JSON；解析失败的响应不会被缓存，重试时重新请求
+            result = safe_orjson_loads(response)
+            if result:
+                logger.info(f"第{attempt + 1}次尝试成功解析响应")
+                break
+            logger.warning(f"第{attempt + 1}次尝试解析JSON失败")
+            if attempt < max_retries - 1:
+                await asyncio.sleep(_backoff_delay(attempt))
+        
+        if not response or not result:
+            return None
+        
+        logger.debug("收到AI响应:\n{:.200}...", response)
+        
+        # 检查结果格式并转换
+        if isinstance(result, list):
+            logger.debug("收到列表格式的响应，将合并结果")
+            if not result:
+                logger.error("需求分析失败：响应列表为空")
+                return None
+            # 使用第一个结果作为基础
+            result = result[0]
+        
+        # 检查结果格式
+        if not isinstance(result, dict):
+            logger.error(f"需求分析失败：响应不是字典类型 - {type(result)}")
+            return None
+        
+        # 处理可能的包装字段
+        if "report" in result:
+            result = result["report"]
+            logger.debug("从 report 字段中提取结果")
+        elif "answer" in result:
+            result = result["answer"]
+            logger.debug("从 answer 字段中提取结果")
+        elif "需求分析报告" in result:
+            result = result["需求分析报告"]
+            logger.debug("从 需求分析报告 字段中提取结果")
+        
+        # 标准化结果（CPU密集，放到线程中执行以免阻塞事件循环）
+        return await asyncio.to_thread(
+            self._normalize_requirement_result, result, bool(image_paths)
+        )
+    
+    async def _analyze_images(
+        self,
+        prompt: str,
+        image_paths: List[str],
+        progress_callback: Optional[Callable[[int, int], None]] = None
+    ) -> Optional[Dict[str, Any]]:
+        """并发分析多张图片并汇总结果
+        
+        Args:
+            prompt: 需求分析提示词
+            image_paths: 图片路径列表
+            progress_callback: 进度回调函数，参数为(已完成图片数, 图片总数)
+            
+        Returns:
+            Optional[Dict[str, Any]]: 汇总后的分析结果
+        """
+        total = len(image_paths)
+        semaphore = asyncio.Semaphore(settings.ai.AI_MAX_CONCURRENCY)
+        
+        async def analyze(index: int, path: str):
+            async with semaphore:
+                try:
+                    return index, await self._request_requirement_analysis(prompt, [path])
+                except Exception as e:
+                    logger.error(f"分析图片失败: {path}, 错误: {str(e)}")
+                    return index, None
+        
+        # 按文件大小分组，组内并发、组间依次执行，避免大图片拖慢同批小图片
+        waves = _bin_by_size([_file_size(path) for path in image_paths])
+        
+        results: List[Optional[Dict[str, Any]]] = [None] * total
+        # 每个结果到达时即序列化，与仍在进行的请求重叠，汇总时无需再序列化
+        serialized: List[Optional[bytes]] = [None] * total
+        completed = 0
+        for wave in waves:
+            for future in asyncio.as_completed(
+                [analyze(index, image_paths[index]) for index in wave]
+            ):
+                index, result = await future
+                results[index] = result
+                if result:
+                    serialized[index] = _serialize_result(result)
+                completed += 1
+                if progress_callback:
+                    await progress_callback(completed, total)
+        
+        image_results = [result for result in results if result]
+        if not image_results:
+            return None
+        
+        logger.info(f"成功分析 {len(image_results)}/{total} 张图片")
+        if len(image_results) == 1:
+            return image_results[0]
+        
+        return await self._summarize_image_results(
+            image_results, [data for data in serialized if data]
+        )
+    
+    async def _summarize_image_results(
+        self,
+        image_results: List[Dict[str, Any]],
+        serialized_results: Optional[List[bytes]] = None
+    ) -> Dict[str, Any]:
+        """汇总多张图片的分析结果，失败时使用第一张图片的结果
+        
+        Args:
+            image_results: 各图片的分析结果
+            serialized_results: 与image_results一一对应的序列化结果，未提供时在此计算
+            
+        Returns:
+            Dict[str, Any]: 汇总结果
+        """
+        normalized_result = image_results[0]
+        if serialized_results is None:
+            serialized_results = [_serialize_result(result) for result in image_results]
+        
+        # 去除完全相同的分析结果（如重复的截图），只剩一个时无需汇总
+        unique_results = dict(zip(serialized_results, image_results))
+        image_results = list(unique_results.values())
+        if len(image_results) == 1:
+            logger.info("各图片分析结果相同，跳过汇总")
+            return normalized_result
+        
+        # 结构一致时直接在本地合并，省去一次模型请求
+        if settings.ai.AI_LOCAL_SUMMARY_MERGE:
+            merged_result = _merge_analysis_results(image_results)
+            if merged_result is not None:
+                logger.info("多图片分析结果结构一致，已在本地合并")
+                return merged_result
+        
+        logger.info("开始生成多图片分析总结")
+        # 分析内容每次都不同，不写入渲染缓存
+        summary_prompt = await asyncio.to_thread(
+            lambda: self.template.render_uncached(
+                "requirement_batch_summary",
+                content=(b"[" + b",".join(unique_results) + b"]").decode()
+            )
+        )
+        
+        if not summary_prompt:
+            return normalized_result
+        
+        try:
+            # 构建总结消息
+            summary_messages = [REQUIREMENT_SUMMARY_SYSTEM_MESSAGE, {
+                "role": "user",
+                "content": summary_prompt
+            }]
+            
+            # 使用chat_graph生成总结
+            logger.info("使用chat_graph生成总结")
+            summary_response = await self.chat_graph.chat(
+                messages=summary_messages,
+                response_format={"type": "json_object"},
+                timeout=180,  # 3分钟超时
+                metadata={
+                    "task_type": "requirement_summary",
+                    "image_count": len(image_results)
+                }
+            )
+            
+            if summary_response:
+                summary_result = safe_orjson_loads(summary_response)
+                if summary_result and isinstance(summary_result, dict):
+                    logger.info("成功生成多图片分析总结")
+                    # 保留原始分析中的某些字段
+                    for key in ['需求背景', '关联信息']:
+                        if key in normalized_result and key not in summary_result:
+                            summary_result[key] = normalized_result[key]
+                    logger.opt(lazy=True).debug("总结果:\n{}", lambda: orjson.dumps(summary_result, option=orjson.OPT_NON_STR_KEYS).decode())
+                    return summary_result
+                
+                logger.warning("总结结果解析失败，将使用原始分析结果")
+                logger.debug("无效的总结响应:\n{:.200}...", summary_response)
+            else:
+                logger.warning("未收到总结响应，将使用原始分析结果")
+                
+        except Exception as e:
+            logger.error(f"生成总结时出错: {str(e)}")
+            logger.warning("将使用原始分析结果")
+        
+        return normalized_result
+    
+    def _normalize_requirement_result(
+        self,
+        result: Dict[str, Any],
+        require_background: bool = False
+    ) -> Dict[str, Any]:
+        """标准化需求分析结果的字段名称，并补全缺失字段
+        
+        Args:
+            result: 原始分析结果
+            require_background: 是否要求包含需求背景字段
+            
+        Returns:
+            Dict[str, Any]: 标准化后的结果
+        """
+        # 标准化字段名称，移除可能的序号前缀（如 "1. "）
+        normalized_result = {key.rpartition(". ")[2]: value for key, value in result.items()}
+        
+        logger.opt(lazy=True).debug("标准化后的结果:\n{}", lambda: orjson.dumps(normalized_result, option=orjson.OPT_NON_STR_KEYS).decode())
+        
+        # 检查必要字段（关联信息不做强制要求）
+        required_fields = (
+            REQUIRED_REQUIREMENT_FIELDS_WITH_BACKGROUND if require_background
+            else REQUIRED_REQUIREMENT_FIELDS
+        )
+        
+        if not required_fields.issubset(normalized_result):
+            missing_fields = set(required_fields.difference(normalized_result))
+            # 如果缺少字段，尝试从原始响应中提取更多信息（预先计算小写字段名，避免重复转换）
+            lower_keys: Dict[str, str] = {}
+            for key in result:
+                lower_keys.setdefault(key.rpartition(". ")[2].lower(), key)
+            for required_field in list(missing_fields):
+                required_lower = required_field.lower()
+                # 检查是否有相似的字段名
+                match = next(
+                    (key for lower_key, key in lower_keys.items()
+                     if required_lower in lower_key or lower_key in required_lower),
+                    None
+                )
+                if match is not None:
+                    normalized_result[required_field] = result[match]
+                    missing_fields.discard(required_field)
+            
+            # 再次检查是否还有缺失字段
+            if missing_fields:
+                logger.warning(f"需求分析缺少字段 - {missing_fields}，但将继续处理")
+        
+        return normalized_result
+    
     async def _process_requirement_batch(
         self,
         content: str,
@@ -350,34 +771,27 @@ class ChatManager:
         """处理单个需求批次"""
         try:
             logger.info(f"开始处理需求批次: {batch_type}")
-            logger.debug(f"批次内容:\n{content}")
+            logger.debug("批次内容:\n{}", content)
             
             messages = [{
                 "role": "system",
-                "content": (
-                    f"你是一个专业的测试用例设计专家。现请专注分析需求中的{batch_type}部分。"
-                    "请结合之前的上下文，确保分析的连续性和完整性。"
-                    "返回格式应为JSON对象。"
-                )
+                "content": REQUIREMENT_BATCH_SYSTEM_TEMPLATE.format(batch_type=batch_type)
             }, {
                 "role": "user",
                 "content": content
             }]
             
             # 添加历史记忆
-            chat_history = self.memory.load_memory_variables({})
-            if chat_history and "chat_history" in chat_history:
-                history_messages = [
-                    {
-                        "role": "assistant" if isinstance(msg, AIMessage) else "user",
-                        "content": msg.content
-                    }
-                    for msg in chat_history["chat_history"]
-                ]
+            history_messages = self.memory.get_openai_history()
+            if history_messages:
                 messages.extend(history_messages)
                 logger.debug(f"添加了 {len(history_messages)} 条历史消息")
             
-            logger.debug(f"发送消息到AI:\n{json.dumps(messages, ensure_ascii=False, indent=2)}")
+            # 历史消息可能重复批次内容，按配置将重复内容替换为引用标注
+            if settings.ai.AI_CONTEXT_DEDUP:
+                messages = dedup_messages(messages)
+            
+            logger.opt(lazy=True).debug("发送消息到AI:\n{}", lambda: orjson.dumps(messages, option=orjson.OPT_NON_STR_KEYS).decode())
             
             response = await self.chat_graph.chat(
                 messages,
@@ -385,10 +799,12 @@ class ChatManager:
                 metadata={
                     "task_type": "requirement_batch",
                     "batch_type": batch_type
-                }
+                },
+                use_cache=True,
+                stream=True
             )
             if response:
-                logger.debug(f"收到AI响应:\n{response[:200]}...")
+                logger.debug("收到AI响应:\n{:.200}...", response)
                 # 更新记忆
                 self.memory.save_context(
                     {"input": content},
@@ -409,7 +825,7 @@ class ChatManager:
         batch_data: Dict[str, Any],
         focus: str,
         retry_count: int = 3,
-        retry_delay: int = 5
+        retry_delay: float = 0.5
     ) -> Optional[List[Dict[str, Any]]]:
         """生成单个批次的测试用例
         
@@ -418,82 +834,65 @@ class ChatManager:
             batch_data: 批次数据
             focus: 关注点
             retry_count: 重试次数
-            retry_delay: 重试延迟(秒)
+            retry_delay: 初始重试延迟(秒)，按指数退避增长
             
         Returns:
             Optional[List[Dict[str, Any]]]: 测试用例列表
         """
+        # 构建提示词（紧凑JSON，减少发送给模型的token数）
+        prompt = TESTCASE_PROMPT_TEMPLATE.format(
+            batch_type=batch_type,
+            data=orjson.dumps(
+                {batch_type: batch_data},
+                option=orjson.OPT_NON_STR_KEYS
+            ).decode(),
+            focus=focus
+        )
+        
         last_error = None
         for attempt in range(retry_count):
             try:
                 logger.info(f"开始生成{batch_type}批次测试用例 (尝试 {attempt + 1}/{retry_count})")
                 
-                # 构建提示词
-                prompt = (
-                    f"请基于下{batch_type}信息生成测试用例：\n\n"
-                    f"{json.dumps({batch_type: batch_data}, ensure_ascii=False, indent=2)}\n\n"
-                    "要求：\n"
-                    f"1. 重点关注{focus}\n"
-                    "2. 包含正向流程和异常场景\n"
-                    "3. 每个功能点生成2-3个用例\n"
-                    "4. 测试用例格式：\n"
-                    "{\n"
-                    "  \"testcases\": [{\n"
-                    "    \"id\": \"TC_001\",\n"
-                    "    \"module\": \"模块名\",\n"
-                    "    \"name\": \"用例名称\",\n"
-                    "    \"level\": \"P0-P3\",\n"
-                    "    \"precondition\": \"前置条件\",\n"
-                    "    \"steps\": [\"步骤1\", \"步骤2\"],\n"
-                    "    \"expected\": [\"预期1\", \"预期2\"],\n"
-                    "    \"actual\": \"\",\n"
-                    "    \"status\": \"\",\n"
-                    "    \"remark\": \"\"\n"
-                    "  }]\n"
-                    "}"
-                )
-                
-                # 发送请求
-                response = await self.chat_graph.chat(
-                    [{
-                        "role": "system",
-                        "content": f"你是测试专家，请专注于{batch_type}相关的测试用例生成。"
-                    }, {
-                        "role": "user",
-                        "content": prompt
-                    }],
-                    response_format={"type": "json_object"},
-                    timeout=180,  # 增加超时时间到3分钟
-                    metadata={
-                        "task_type": "testcase_generation",
-                        "batch_type": batch_type,
-                        "attempt": attempt + 1,
-                        "max_retries": retry_count
-                    }
-                )
+                # 流式发送请求（限制并发数），JSON对象闭合后即结束接收
+                parts = []
+                async with self._batch_semaphore:
+                    async for chunk in self.chat_graph.chat_stream(
+                        [{
+                            "role": "system",
+                            "content": TESTCASE_SYSTEM_TEMPLATE.format(batch_type=batch_type)
+                        }, {
+                            "role": "user",
+                            "content": prompt
+                        }],
+                        response_format={"type": "json_object"},
+                        timeout=180,  # 增加超时时间到3分钟
+                        metadata={
+                            "task_type": "testcase_generation",
+                            "batch_type": batch_type,
+                            "attempt": attempt + 1,
+                            "max_retries": retry_count
+                        },
+                        use_cache=True,
+                        validate=_is_testcase_response
+                    ):
+                        parts.append(chunk)
+                response = "".join(parts)
                 
                 if not response:
                     logger.warning(f"{batch_type}批次生成失败，尝试次数: {attempt + 1}")
                     if attempt < retry_count - 1:
-                        await asyncio.sleep(retry_delay)
-                        continue
-                    return None
-                
-                # 解析响应
-                result = safe_json_loads(response)
-                if not result:
-                    logger.error(f"{batch_type}批次响应解析失败")
-                    if attempt < retry_count - 1:
-                        await asyncio.sleep(retry_delay)
+                        await asyncio.sleep(_backoff_delay(attempt, retry_delay))
                         continue
                     return None
                 
-                # 验证测试用例格式
-                testcases = result.get("testcases")
+                # 解析并验证响应；格式错误的响应不会被缓存，重试时重新请求
+                result = safe_orjson_loads(response)
+                testcases = result.get("testcases") if isinstance(result, dict) else None
                 if not isinstance(testcases, list):
-                    logger.error(f"{batch_type}批次响应格式错误")
+                    logger.error(f"{batch_type}批次响应格式错误，尝试次数: {attempt + 1}")
                     if attempt < retry_count - 1:
-                        await asyncio.sleep(retry_delay)
+                        await asyncio.sleep(_backoff_delay(attempt, retry_delay))
                         continue
                     return None
                 
@@ -502,10 +901,12 @@ class ChatManager:
                 
             except Exception as e:
                 last_error = e
+                if not _is_retriable(e):
+                    logger.error(f"{batch_type}批次生成出错，错误不可重试: {str(e)}")
+                    break
                 logger.error(f"{batch_type}批次生成出错 (尝试 {attempt + 1}/{retry_count}): {str(e)}")
                 if attempt < retry_count - 1:
-                    await asyncio.sleep(retry_delay)
-                    continue
+                    await asyncio.sleep(_backoff_delay(attempt, retry_delay))
         
         if last_error:
             logger.error(f"{batch_type}批次生成最终失败: {str(last_error)}")
@@ -517,7 +918,7 @@ class ChatManager:
         summary: Dict[str, Any],
         details: Optional[Dict[str, Any]] = None,
         project_name: Optional[str] = None,
-        progress_callback: Optional[Callable[[str, None], None]] = None
+        progress_callback: Optional[Callable[..., Awaitable[None]]] = None
     ) -> Optional[List[Dict[str, Any]]]:
         """生成测试用例
         
@@ -525,7 +926,7 @@ class ChatManager:
             summary: 需求分析结果
             details: 额外的细节信息
             project_name: 项目名称
-            progress_callback: 进度回调函数，参数为(当前阶段, None)
+            progress_callback: 进度回调函数，参数为(已完成批次数, 批次总数, stage='generate')
             
         Returns:
             Optional[List[Dict[str, Any]]]: 测试用例列表
@@ -543,9 +944,6 @@ class ChatManager:
                 "系统交互": summary.get("系统交互关系", {})
             }
             
-            # 分批生成测试用例
-            all_testcases = []
-            
             # 定义批次配置
             batches = [
                 {
@@ -565,46 +963,64 @@ class ChatManager:
                 }
             ]
             
-            # 处理每个批次
-            for batch in batches:
-                # 更新进度
+            # 各批次相互独立，并发生成，每完成一个批次更新一次进度
+            async def run_batch(index: int, batch: Dict[str, Any]):
+                try:
+                    return index, await self._generate_batch_testcases(
+                        batch_type=batch["type"],
+                        batch_data=batch["data"],
+                        focus=batch["focus"]
+                    )
+                except Exception as e:
+                    return index, e
+            
+            # 按数据量从大到小派发，开销最大的批次最先开始
+            dispatch_order = sorted(
+                range(len(batches)),
+                key=lambda index: len(orjson.dumps(batches[index]["data"], option=orjson.OPT_NON_STR_KEYS)),
+                reverse=True
+            )
+            
+            results: List[Any] = [None] * len(batches)
+            for completed, future in enumerate(asyncio.as_completed(
+                [run_batch(index, batches[index]) for index in dispatch_order]
+            ), 1):
+                index, batch_cases = await future
+                results[index] = batch_cases
                 if progress_callback:
-                    progress_callback(batch["type"], None)
+                    await progress_callback(completed, len(batches), stage='generate')
+            
+            # 按批次顺序收集结果，最后一次性合并
+            batch_results: List[List[Dict[str, Any]]] = []
+            for batch, batch_cases in zip(batches, results):
+                if isinstance(batch_cases, Exception):
+                    logger.error(f"{batch['type']}部分生成出错: {str(batch_cases)}")
+                    continue
                     
-                batch_cases = await self._generate_batch_testcases(
-                    batch_type=batch["type"],
-                    batch_data=batch["data"],
-                    focus=batch["focus"]
-                )
-                
                 if batch_cases:
-                    all_testcases.extend(batch_cases)
+                    batch_results.append(batch_cases)
                     logger.info(f"{batch['type']}部分生成了 {len(batch_cases)} 个测试用例")
             
+            all_testcases = list(itertools.chain.from_iterable(batch_results))
+            
             if not all_testcases:
                 logger.error("没有生成有效的测试用例")
                 return None
             
-            # 验证和规范化测试用例
-            valid_testcases = []
-            required_fields = ['id', 'module', 'name', 'level', 'precondition', 'steps', 'expected']
-            
-            for idx, testcase in enumerate(all_testcases, 1):
-                if not isinstance(testcase, dict):
-                    continue
-                    
-                if all(field in testcase for field in required_fields):
-                    # 确保steps和expected是列表
-                    testcase['steps'] = [testcase['steps']] if isinstance(testcase['steps'], str) else testcase['steps']
-                    testcase['expected'] = [testcase['expected']] if isinstance(testcase['expected'], str) else testcase['expected']
-                    # 确保ID不重复
-                    testcase['id'] = f"TC_{idx:03d}"
-                    # 设置项目名称
-                    if project_name:
-                        testcase['project'] = project_name
-                    valid_testcases.append(testcase)
-            
-            return valid_testcases
+            # 验证和规范化测试用例：确保steps和expected是列表、ID不重复，并设置项目名称
+            required = REQUIRED_TESTCASE_FIELDS
+            extra = {'project': project_name} if project_name else {}
+            return [
+                {
+                    **testcase,
+                    'steps': [testcase['steps']] if type(testcase['steps']) is str else testcase['steps'],
+                    'expected': [testcase['expected']] if type(testcase['expected']) is str else testcase['expected'],
+                    'id': f"TC_{idx:03d}",
+                    **extra
+                }
+                for idx, testcase in enumerate(all_testcases, 1)
+                if type(testcase) is dict and required.issubset(testcase)
+            ]
             
         except Exception as e:
             logger.error(f"生成测试用例失败: {str(e)}")
@@ -628,19 +1044,21 @@ class ChatManager:
         try:
             logger.info(f"开始导出测试用例为PlantUML格式，图表类型: {diagram_type}")
             
-            generator = PlantUMLGenerator()
+            generator = get_plantuml_generator()
             
+            # 图表生成为纯CPU计算，放到线程中执行以免阻塞事件循环
             if diagram_type == "mindmap":
                 logger.info("生成思维导图")
-                return generator.generate_mindmap(testcases)
+                return await asyncio.to_thread(generator.generate_mindmap, testcases)
             elif diagram_type == "sequence":
                 logger.info("生成时序图")
                 # 对于时序图，每个用例生成单独的图
-                sequence_diagrams = []
-                for case in testcases:
-                    diagram = generator.generate_sequence(case)
-                    if diagram:
-                        sequence_diagrams.append(diagram)
+                sequence_diagrams = await asyncio.to_thread(
+                    lambda: [
+                        diagram for diagram in map(generator.generate_sequence, testcases)
+                        if diagram
+                    ]
+                )
                 
                 if not sequence_diagrams:
                     logger.error("没有生成任何时序图")
@@ -654,3 +1072,5 @@ class ChatManager:
         except Exception as e:
             logger.error(f"导出PlantUML失败: {str(e)}")
             return None
+
+__all__ = ["ChatManager", "ChatMemory"]
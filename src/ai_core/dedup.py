@@ -0,0 +1,88 @@
+"""
+上下文去重
+"""
+
+from typing import Any, Dict, List
+import hashlib
+
+# 超过该长度的消息内容按内容定义分块后再去重
+CHUNK_THRESHOLD = 1024
+# 行哈希对该值取模为0时作为分块边界
+CHUNK_BOUNDARY_MOD = 64
+# 小于该长度的分块不做替换，避免引用标注比原文更长
+MIN_CHUNK_SIZE = 128
+
+def _digest(text: str) -> str:
+    """计算文本摘要"""
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+
+def _split_chunks(content: str) -> List[str]:
+    """按内容定义的边界切分文本
+    
+    边界只由行内容决定，因此相同的文本片段在不同消息中会被切成相同的块。
+    
+    Args:
+        content: 文本内容
+        
+    Returns:
+        List[str]: 文本块列表
+    """
+    chunks = []
+    current = []
+    for line in content.splitlines(keepends=True):
+        current.append(line)
+        if int(_digest(line)[:8], 16) % CHUNK_BOUNDARY_MOD == 0:
+            chunks.append("".join(current))
+            current = []
+    if current:
+        chunks.append("".join(current))
+    return chunks
+
+def dedup_messages(messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """去除消息列表中重复的上下文内容
+    
+    1. 与前面某条消息完全相同的消息替换为引用标注
+    2. 较长的消息按内容定义分块，已出现过的块替换为引用标注
+    
+    引用只指向同一请求中的前序消息，系统消息保持不变。
+    
+    Args:
+        messages: 消息列表
+        
+    Returns:
+        List[Dict[str, Any]]: 去重后的消息列表，原消息不会被修改
+    """
+    seen_messages: Dict[str, int] = {}
+    seen_chunks: Dict[str, int] = {}
+    result = []
+    
+    for index, msg in enumerate(messages, 1):
+        content = msg.get("content")
+        if msg.get("role") == "system" or not isinstance(content, str):
+            result.append(msg)
+            continue
+        
+        key = _digest(content)
+        if key in seen_messages:
+            result.append({**msg, "content": f"[同第{seen_messages[key]}条消息内容]"})
+            continue
+        seen_messages[key] = index
+        
+        if len(content) > CHUNK_THRESHOLD:
+            parts = []
+            for chunk in _split_chunks(content):
+                chunk_key = _digest(chunk)
+                if len(chunk) >= MIN_CHUNK_SIZE and chunk_key in seen_chunks:
+                    parts.append(f"[同第{seen_chunks[chunk_key]}条消息中的内容]\n")
+                else:
+                    seen_chunks.setdefault(chunk_key, index)
+                    parts.append(chunk)
+            deduped = "".join(parts)
+            if len(deduped) < len(content):
+                msg = {**msg, "content": deduped}
+        
+        result.append(msg)
+    
+    return result
+
+__all__ = ["dedup_messages"]
@@ -8,6 +8,7 @@ from langchain_core.runnables import RunnableConfig
 from langgraph.graph import StateGraph, END
 from src.config.settings import settings
 from src.logger.logger import logger
+import functools
 import os
 import uuid
 
@@ -17,52 +18,67 @@ class BaseState(TypedDict):
     response: Optional[str]
     error: Optional[str]
 
+# LangSmith 相关环境变量
+LANGSMITH_ENV_KEYS = (
+    "LANGCHAIN_TRACING_V2",
+    "LANGCHAIN_ENDPOINT",
+    "LANGCHAIN_API_KEY",
+    "LANGSMITH_API_KEY",
+    "LANGCHAIN_PROJECT",
+    "LANGCHAIN_SESSION",
+    "LANGCHAIN_TAGS",
+    "LANGCHAIN_CALLBACKS_BACKGROUND"
+)
+
+@functools.lru_cache(maxsize=1)
+def _init_langsmith(tracing: bool) -> Optional[str]:
+    """初始化 LangSmith 追踪，进程内只执行一次，开关变化时重新执行
+    
+    Args:
+        tracing: 是否启用追踪
+        
+    Returns:
+        Optional[str]: 追踪会话ID，未启用时返回None
+    """
+    if not tracing:
+        # 清理环境变量
+        for key in LANGSMITH_ENV_KEYS:
+            os.environ.pop(key, None)
+        logger.info("LangSmith 追踪已禁用")
+        return None
+    
+    session = str(uuid.uuid4())
+    
+    # 设置环境变量
+    os.environ["LANGCHAIN_TRACING_V2"] = "true"
+    os.environ["LANGCHAIN_ENDPOINT"] = settings.ai.LANGSMITH_ENDPOINT
+    os.environ["LANGCHAIN_API_KEY"] = settings.ai.LANGSMITH_API_KEY
+    os.environ["LANGSMITH_API_KEY"] = settings.ai.LANGSMITH_API_KEY  # 同时设置两个 API KEY
+    os.environ["LANGCHAIN_PROJECT"] = settings.ai.LANGSMITH_PROJECT
+    os.environ["LANGCHAIN_SESSION"] = session
+    os.environ["LANGCHAIN_TAGS"] = "testboom"
+    os.environ["LANGCHAIN_CALLBACKS_BACKGROUND"] = "false"
+    
+    logger.info(
+        "LangSmith 追踪已启用",
+        extra={
+            "endpoint": settings.ai.LANGSMITH_ENDPOINT,
+            "project": settings.ai.LANGSMITH_PROJECT,
+            "session": session,
+            "tags": os.environ["LANGCHAIN_TAGS"],
+            "api_key": "***" + settings.ai.LANGSMITH_API_KEY[-4:]  # 只显示最后4位
+        }
+    )
+    return session
+
 class BaseGraph:
     """LangGraph基础类"""
     
     def __init__(self):
         """初始化基础图"""
-        self._init_langsmith()
+        self.langsmith_session = _init_langsmith(settings.ai.LANGSMITH_TRACING)
         self.graph = StateGraph(state_schema=BaseState)
     
-    def _init_langsmith(self):
-        """初始化 LangSmith 追踪"""
-        if settings.ai.LANGSMITH_TRACING:
-            # 设置环境变量
-            os.environ["LANGCHAIN_TRACING_V2"] = "true"
-            os.environ["LANGCHAIN_ENDPOINT"] = settings.ai.LANGSMITH_ENDPOINT
-            os.environ["LANGCHAIN_API_KEY"] = settings.ai.LANGSMITH_API_KEY
-            os.environ["LANGSMITH_API_KEY"] = settings.ai.LANGSMITH_API_KEY  # 同时设置两个 API KEY
-            os.environ["LANGCHAIN_PROJECT"] = settings.ai.LANGSMITH_PROJECT
-            os.environ["LANGCHAIN_SESSION"] = str(uuid.uuid4())
-            os.environ["LANGCHAIN_TAGS"] = "testboom"
-            os.environ["LANGCHAIN_CALLBACKS_BACKGROUND"] = "false"
-
-            logger.info(
-                "LangSmith 追踪已启用",
-                extra={
-                    "endpoint": settings.ai.LANGSMITH_ENDPOINT,
-                    "project": settings.ai.LANGSMITH_PROJECT,
-                    "session": os.environ["LANGCHAIN_SESSION"],
-                    "tags": os.environ["LANGCHAIN_TAGS"],
-                    "api_key": "***" + settings.ai.LANGSMITH_API_KEY[-4:]  # 只显示最后4位
-                }
-            )
-        else:
-            # 清理环境变量
-            for key in [
-                "LANGCHAIN_TRACING_V2",
-                "LANGCHAIN_ENDPOINT",
-                "LANGCHAIN_API_KEY",
-                "LANGSMITH_API_KEY",
-                "LANGCHAIN_PROJECT",
-                "LANGCHAIN_SESSION",
-                "LANGCHAIN_TAGS",
-                "LANGCHAIN_CALLBACKS_BACKGROUND"
-            ]:
-                os.environ.pop(key, None)
-            logger.info("LangSmith 追踪已禁用")
-    
     def get_config(self, **kwargs) -> RunnableConfig:
         """获取运行配置
         
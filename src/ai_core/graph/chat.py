@@ -2,51 +2,77 @@
 基于LangGraph的对话管理器
 """
 
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, Optional, AsyncIterator, Callable
 from typing_extensions import TypedDict, NotRequired
 from loguru import logger
 from langgraph.graph import StateGraph, START, END
-from src.ai_core.zhipu_api import ZhipuAI
-from src.ai_core.prompt_template import PromptTemplate
+from src.ai_core.zhipu_api import get_zhipu_ai
+from src.ai_core.response_cache import response_cache, file_fingerprints, is_json_response
+from src.ai_core.prompt_template import get_prompt_template
 from src.config.settings import settings
-from pathlib import Path
+from src.utils.common import extract_json_block, JSON_OBJECT_START_PATTERN
 import uuid
+import contextlib
+import itertools
 from langchain_core.runnables import RunnableConfig
 from langchain_core.callbacks import BaseCallbackHandler
 
+# 默认运行标签
+DEFAULT_TAGS = ("testboom", "chat")
+
 class ChatState(TypedDict):
     messages: List[Dict[str, str]]
     response: Optional[str]
     error: Optional[str]
-    template_name: NotRequired[str]
-    template_args: NotRequired[Dict[str, Any]]
-    response_format: NotRequired[Dict[str, str]]
+    template_name: NotRequired[Optional[str]]
+    template_args: NotRequired[Optional[Dict[str, Any]]]
+    response_format: NotRequired[Optional[Dict[str, str]]]
     timeout: NotRequired[int]
+    use_cache: NotRequired[bool]
+    validate: NotRequired[Optional[Callable[[str], bool]]]
+    stream: NotRequired[bool]
+    metadata: NotRequired[Optional[Dict[str, Any]]]
+
+async def _chat_node(state: ChatState, config: RunnableConfig) -> ChatState:
+    """对话节点，分派到发起请求的ChatGraph实例"""
+    return await config["configurable"]["chat_graph"]._process_and_generate(state)
 
 class ChatGraph:
+    # 所有实例共享的图和已编译工作流
+    _graph: Optional[StateGraph] = None
+    _workflow = None
+    
     def __init__(self):
-        # 初始化AI客户端
-        self.ai = ZhipuAI()
-        
-        # 初始化提示词模板
-        template_dir = str(settings.BASE_DIR / "resources/prompts")
-        self.template = PromptTemplate(template_dir=template_dir)
-        logger.info(f"已加载提示词模板，目录: {template_dir}")
-        
-        # 初始化图
-        self.graph = StateGraph(state_schema=ChatState)
+        # 初始化AI客户端（进程内共享）
+        self.ai = get_zhipu_ai()
         
-        # 添加节点
-        self.graph.add_node("process_message", self._process_message)
-        self.graph.add_node("generate_response", self._generate_response)
+        # 初始化提示词模板（进程内共享）
+        self.template = get_prompt_template()
+        logger.info(f"已加载提示词模板，目录: {self.template.template_dir}")
         
-        # 添加边
-        self.graph.add_edge(START, "process_message")
-        self.graph.add_edge("process_message", "generate_response")
-        self.graph.add_edge("generate_response", END)
+        # 获取已编译的图
+        self.graph, self.workflow = self._get_workflow()
         
-        # 编译图
-        self.workflow = self.graph.compile()
+        # 仅在启用追踪时经由工作流执行，便于在LangSmith中记录运行
+        self.use_graph = settings.ai.LANGSMITH_TRACING
+    
+    @classmethod
+    def _get_workflow(cls):
+        """构建并编译工作流，只在首次调用时执行"""
+        if cls._workflow is None:
+            graph = StateGraph(state_schema=ChatState)
+            
+            # 消息处理和响应生成之间没有分支，合并为单个节点，省去节点间的状态传递
+            graph.add_node("chat", _chat_node)
+            
+            # 添加边
+            graph.add_edge(START, "chat")
+            graph.add_edge("chat", END)
+            
+            # 编译图
+            cls._graph = graph
+            cls._workflow = graph.compile()
+        return cls._graph, cls._workflow
 
     def get_config(
         self,
@@ -68,53 +94,49 @@ class ChatGraph:
         Returns:
             RunnableConfig: 配置字典
         """
-        # 基础配置
-        config = {
+        # 每次运行只生成一个唯一标识
+        run_id = uuid.uuid4().hex
+        return {
             "configurable": {
                 "response_format": response_format,
                 "timeout": timeout,
-                "run_name": str(uuid.uuid4()),
+                "run_name": run_id,
             },
+            # 合并额外的元数据
             "metadata": {
                 "template_name": "chat",
                 "response_format": response_format,
                 "timeout": timeout,
+                **(metadata or {}),
             },
-            "tags": tags or ["testboom", "chat"],
+            "tags": tags or list(DEFAULT_TAGS),
             "callbacks": callbacks or [],
             "recursion_limit": 25,  # 防止无限递归
-            "run_name": f"testboom-chat-{uuid.uuid4()}",  # 确保每次运行都有唯一的名称
+            "run_name": f"testboom-chat-{run_id}",  # 确保每次运行都有唯一的名称
         }
 
-        # 合并额外的元数据
-        if metadata:
-            config["metadata"].update(metadata)
-
-        return config
-
     async def _process_message(self, state: ChatState) -> ChatState:
         """处理消息"""
         try:
-            messages = state.get("messages", [])
+            messages = state.get("messages")
             if not messages:
                 state["error"] = "消息列表为空"
                 return state
                 
             # 处理模板
             template_name = state.get("template_name")
-            template_args = state.get("template_args", {})
             if template_name:
                 try:
                     # 使用模板生成提示词
-                    prompt = self.template.render(template_name, **(template_args or {}))
+                    prompt = self.template.render(template_name, **(state.get("template_args") or {}))
                     if prompt:
-                        messages.insert(0, {"role": "system", "content": prompt})
+                        # 构建新列表，不修改调用方传入的消息列表
+                        state["messages"] = [{"role": "system", "content": prompt}, *messages]
                     else:
                         logger.warning(f"模板 {template_name} 渲染失败，将继续处理原始消息")
                 except Exception as e:
                     logger.warning(f"处理模板 {template_name} 失败: {str(e)}，将继续处理原始消息")
                 
-            state["messages"] = messages
             return state
             
         except Exception as e:
@@ -122,21 +144,28 @@ class ChatGraph:
             state["error"] = str(e)
             return state
 
+    async def _process_and_generate(self, state: ChatState) -> ChatState:
+        """处理消息并生成响应"""
+        return await self._generate_response(await self._process_message(state))
+
     async def _generate_response(self, state: ChatState) -> ChatState:
         """生成响应"""
         try:
             if state.get("error"):
                 return state
-                
-            messages = state.get("messages", [])
+            
+            # 一次性取出状态字段，后续只使用局部变量
+            messages = state.get("messages") or ()
             response_format = state.get("response_format")
-            timeout = state.get("timeout", 60)
+            timeout = state.get("timeout") or 60
+            use_cache = state.get("use_cache")
+            validate = state.get("validate") or is_json_response
+            stream = state.get("stream")
             
             # 获取运行配置
             config = self.get_config(
-                callbacks=[],
-                tags=["testboom", "chat"],
                 metadata={
+                    **(state.get("metadata") or {}),
                     "template_name": state.get("template_name"),
                     "response_format": response_format,
                     "timeout": timeout
@@ -144,39 +173,63 @@ class ChatGraph:
             )
             
             # 检查是否包含图片
-            image_paths = []
-            for msg in messages:
-                if isinstance(msg, dict) and msg.get("images"):
-                    image_paths.extend(msg["images"])
+            image_paths = list(itertools.chain.from_iterable(
+                msg["images"] for msg in messages if msg.get("images")
+            ))
             
             # 根据是否有图片选择不同的调用方法
             if image_paths:
                 logger.info(f"使用视觉模型处理 {len(image_paths)} 张图片")
-                response = await self.ai.chat_with_images(
-                    messages=messages,
-                    image_paths=image_paths,
-                    task_id=state.get("task_id"),
-                    config=config
-                )
+                # 图片路径可能被复用，缓存键需包含文件大小和修改时间
+                key = None
+                response = None
+                if use_cache:
+                    key = response_cache.make_key(messages, files=file_fingerprints(image_paths))
+                    response = response_cache.get(key)
+                    if response is not None:
+                        logger.info("命中响应缓存")
+                if response is None:
+                    response = await self.ai.chat_with_images(
+                        messages=messages,
+                        image_paths=image_paths,
+                        task_id=state.get("task_id"),
+                        config=config,
+                        use_cache=bool(use_cache)
+                    )
+                    # 只缓存通过校验的响应，避免格式错误的结果在过期前被反复返回
+                    if key is not None and response and validate(response):
+                        response_cache.set(key, response)
             else:
                 logger.info("使用对话模型处理请求")
-                response = await self.ai.chat(
-                    messages=messages,
-                    response_format=response_format,
-                    timeout=timeout,
-                    config=config
-                )
+                if use_cache:
+                    response = await self.ai.chat_cached(
+                        messages=messages,
+                        response_format=response_format,
+                        timeout=timeout,
+                        config=config,
+                        stream=bool(stream),
+                        validate=validate
+                    )
+                elif stream and response_format and response_format.get("type") == "json_object":
+                    response = await self.ai.chat_stream_json(
+                        messages=messages,
+                        response_format=response_format,
+                        timeout=timeout,
+                        config=config
+                    )
+                else:
+                    response = await self.ai.chat(
+                        messages=messages,
+                        response_format=response_format,
+                        timeout=timeout,
+                        config=config
+                    )
             
             # 处理JSON格式
             if response and response_format and response_format.get("type") == "json_object":
-                if not response.strip().startswith("{"):
+                if not JSON_OBJECT_START_PATTERN.match(response):
                     # 提取JSON内容
-                    import re
-                    json_match = re.search(r'```json\s*(\{.*?\})\s*```', response, re.DOTALL)
-                    if json_match:
-                        response = json_match.group(1)
-                    else:
-                        response = "{}"
+                    response = extract_json_block(response) or "{}"
             
             state["response"] = response
             return state
@@ -193,7 +246,10 @@ class ChatGraph:
         template_args: Dict[str, Any] = None,
         response_format: Dict[str, str] = None,
         timeout: int = None,
-        metadata: Dict[str, Any] = None
+        metadata: Dict[str, Any] = None,
+        use_cache: bool = False,
+        stream: bool = False,
+        validate: Optional[Callable[[str], bool]] = None
     ) -> str:
         """聊天入口
 
@@ -204,37 +260,48 @@ class ChatGraph:
             response_format: 响应格式
             timeout: 超时时间
             metadata: 元数据
+            use_cache: 是否使用响应缓存
+            stream: 是否流式接收JSON响应
+            validate: 写入缓存前的响应校验函数，默认只要求可解析为JSON
 
         Returns:
             str: 响应内容
         """
         try:
-            # 准备初始状态
+            # 入口处统一消息结构，后续节点可直接按字典访问
+            if not all(isinstance(msg, dict) for msg in messages):
+                messages = [
+                    msg if isinstance(msg, dict) else {"role": "user", "content": str(msg)}
+                    for msg in messages
+                ]
+            
+            # 准备初始状态，始终包含全部字段，保证每次调用的状态结构一致
             state: ChatState = {
                 "messages": messages,
                 "response": None,
-                "error": None
+                "error": None,
+                "template_name": template_name,
+                "template_args": template_args,
+                "response_format": response_format,
+                "timeout": timeout or 60,
+                "use_cache": use_cache,
+                "validate": validate,
+                "stream": stream,
+                "metadata": metadata,
             }
-            
-            if template_name:
-                state["template_name"] = template_name
-                state["template_args"] = template_args
-                
-            if response_format:
-                state["response_format"] = response_format
                 
-            if timeout:
-                state["timeout"] = timeout
-                
-            # 执行工作流
-            result = await self.workflow.ainvoke(
-                state,
-                config=self.get_config(
+            if self.use_graph:
+                # 执行工作流
+                config = self.get_config(
                     response_format=response_format,
                     timeout=timeout,
                     metadata=metadata
                 )
-            )
+                config["configurable"]["chat_graph"] = self
+                result = await self.workflow.ainvoke(state, config=config)
+            else:
+                # 未启用追踪时直接调用，跳过图调度和状态复制
+                result = await self._process_and_generate(state)
             
             if result.get("error"):
                 logger.error(f"聊天失败: {result['error']}")
@@ -244,4 +311,81 @@ class ChatGraph:
             
         except Exception as e:
             logger.error(f"聊天异常: {str(e)}")
-            return None 
\ No newline at end of file
+            return None
+
+    async def chat_stream(
+        self,
+        messages: List[Dict[str, str]],
+        template_name: str = None,
+        template_args: Dict[str, Any] = None,
+        response_format: Dict[str, str] = None,
+        timeout: int = None,
+        metadata: Dict[str, Any] = None,
+        use_cache: bool = False,
+        validate: Optional[Callable[[str], bool]] = None
+    ) -> AsyncIterator[str]:
+        """流式聊天入口，逐段返回响应内容
+
+        JSON格式的请求只输出顶层对象，对象闭合后立即结束。请求异常和响应截断
+        （TruncatedResponseError）会直接抛出，由调用方决定是否重试，此时不写入缓存。
+
+        Args:
+            messages: 消息列表
+            template_name: 模板名称
+            template_args: 模板参数
+            response_format: 响应格式
+            timeout: 超时时间
+            metadata: 元数据
+            use_cache: 是否使用响应缓存
+            validate: 写入缓存前的响应校验函数，JSON格式默认要求可解析
+
+        Yields:
+            str: 增量响应内容
+        """
+        state = await self._process_message({
+            "messages": messages,
+            "response": None,
+            "error": None,
+            "template_name": template_name,
+            "template_args": template_args
+        })
+        if state.get("error"):
+            logger.error(f"聊天失败: {state['error']}")
+            return
+        messages = state["messages"]
+        
+        key = None
+        if use_cache:
+            key = response_cache.make_key(messages, response_format=response_format)
+            cached = response_cache.get(key)
+            if cached is not None:
+                logger.info("命中响应缓存")
+                yield cached
+                return
+        
+        # 与非流式请求使用相同的运行配置，保证流式请求同样被追踪
+        config = self.get_config(
+            metadata={
+                **(metadata or {}),
+                "template_name": template_name,
+                "response_format": response_format,
+                "timeout": timeout
+            }
+        )
+        if response_format and response_format.get("type") == "json_object":
+            stream = self.ai.chat_stream_json_chunks(messages, response_format, timeout, config)
+            validate = validate or is_json_response
+        else:
+            stream = self.ai.chat_stream(messages, response_format, timeout, config)
+        
+        parts = []
+        async with contextlib.aclosing(stream) as chunks:
+            async for chunk in chunks:
+                parts.append(chunk)
+                yield chunk
+        
+        if key is not None and parts:
+            response = "".join(parts)
+            # 只缓存通过校验的响应，调用方解析失败后重试时会重新发送请求
+            if validate is None or validate(response):
+                response_cache.set(key, response)
@@ -0,0 +1,118 @@
+"""
+对话记忆管理
+"""
+
+from typing import List, Dict, Any, Literal, Optional
+from langchain_core.chat_history import BaseChatMessageHistory
+from langchain_core.messages import HumanMessage, AIMessage
+from langchain_core.memory import BaseMemory
+from langchain_community.chat_message_histories import ChatMessageHistory
+from pydantic import Field, PrivateAttr
+
+# 消息类型到对话角色的映射
+_ROLE_BY_TYPE = {"ai": "assistant", "human": "user", "system": "system"}
+
+def _shingle_similarity(a: str, b: str, size: int = 3) -> float:
+    """计算两段文本字符级n-gram集合的Jaccard相似度"""
+    if a == b:
+        return 1.0
+    shingles_a = {a[i:i + size] for i in range(max(len(a) - size + 1, 1))}
+    shingles_b = {b[i:i + size] for i in range(max(len(b) - size + 1, 1))}
+    union = len(shingles_a | shingles_b)
+    return len(shingles_a & shingles_b) / union if union else 1.0
+
+class ChatMemory(BaseMemory):
+    """自定义聊天记忆管理"""
+    
+    chat_history: BaseChatMessageHistory = Field(default_factory=ChatMessageHistory)
+    return_messages: bool = Field(default=True)
+    version: int = Field(default=0)  # 记忆变更计数，用于判断缓存是否失效
+    # 去重策略：append-始终追加，strict-跳过与上一轮完全相同的对话，
+    # update-与上一轮输入高度相似时用新对话替换上一轮
+    deduplication_policy: Literal["append", "strict", "update"] = Field(default="append")
+    similarity_threshold: float = Field(default=0.85)
+    # 对话格式历史消息缓存，记忆变更后失效
+    _openai_format_cache: Optional[List[Dict[str, str]]] = PrivateAttr(default=None)
+    # 字符串格式历史缓存，记忆变更后失效
+    _chat_string_cache: Optional[str] = PrivateAttr(default=None)
+    
+    def clear(self) -> None:
+        """清除历史记忆"""
+        self.chat_history.clear()
+        self._mark_changed()
+    
+    @property
+    def memory_variables(self) -> List[str]:
+        """获取记忆变量列表"""
+        return ["chat_history"]
+    
+    def load_memory_variables(self, inputs: Dict[str, Any]) -> Dict[str, Any]:
+        """加载记忆变量
+        
+        Args:
+            inputs: 输入参数
+            
+        Returns:
+            Dict[str, Any]: 包含历史记忆的字典
+        """
+        if self.return_messages:
+            return {"chat_history": self.chat_history.messages}
+        
+        return {"chat_history": self._get_chat_string()}
+    
+    def save_context(self, inputs: Dict[str, Any], outputs: Dict[str, Any]) -> None:
+        """保存上下文
+        
+        Args:
+            inputs: 输入内容
+            outputs: 输出内容
+        """
+        input_str = inputs.get("input", "")
+        output_str = outputs.get("output", "")
+        
+        messages = self.chat_history.messages
+        if self.deduplication_policy != "append" and len(messages) >= 2:
+            last_input = messages[-2].content
+            last_output = messages[-1].content
+            if self.deduplication_policy == "strict":
+                if input_str == last_input and output_str == last_output:
+                    return
+            elif _shingle_similarity(input_str, last_input) > self.similarity_threshold:
+                messages[-2] = HumanMessage(content=input_str)
+                messages[-1] = AIMessage(content=output_str)
+                self._mark_changed()
+                return
+        
+        self.chat_history.add_message(HumanMessage(content=input_str))
+        self.chat_history.add_message(AIMessage(content=output_str))
+        self._mark_changed()
+    
+    def _mark_changed(self) -> None:
+        """记录记忆变更，并使转换结果缓存失效"""
+        self.version += 1
+        self._openai_format_cache = None
+        self._chat_string_cache = None
+    
+    def get_openai_history(self) -> List[Dict[str, str]]:
+        """获取对话格式的历史消息，记忆未变更时复用上次的转换结果
+        
+        Returns:
+            List[Dict[str, str]]: 历史消息列表
+        """
+        if self._openai_format_cache is None:
+            role_by_type = _ROLE_BY_TYPE.get
+            self._openai_format_cache = [
+                {"role": role_by_type(msg.type, "user"), "content": msg.content}
+                for msg in self.chat_history.messages
+            ]
+        return self._openai_format_cache
+    
+    def _get_chat_string(self) -> str:
+        """获取聊天历史字符串"""
+        if self._chat_string_cache is None:
+            self._chat_string_cache = "\n".join(
+                f"{msg.type}: {msg.content}" for msg in self.chat_history.messages
+            )
+        return self._chat_string_cache
+
+__all__ = ["ChatMemory"]
@@ -1,8 +1,10 @@
-from typing import Dict, Optional
+from typing import Dict, Optional, Tuple, Any
 from pathlib import Path
-import json
+import functools
+import orjson
 from ..logger.logger import logger
 from ..utils.common import safe_file_read, safe_file_write
+from ..config.settings import settings
 from jinja2 import Template, Environment, BaseLoader
 
 class PromptTemplate:
@@ -13,25 +15,63 @@ class PromptTemplate:
         self.template_dir = Path(template_dir or "resources/prompts")
         self.templates = {}
         self.env = Environment(loader=BaseLoader())
+        # 已编译的模板缓存
+        self._compiled: Dict[str, Template] = {}
+        # 渲染结果缓存，相同模板和参数直接复用上次的结果
+        self._render_cached = functools.lru_cache(maxsize=256)(self._render)
         self._load_templates()
     
     def _load_templates(self) -> None:
         """加载所有模板文件"""
         try:
             self.template_dir.mkdir(parents=True, exist_ok=True)
-            content = safe_file_read(self.template_dir / "templates.json")
+            # 以bytes读取，由orjson直接解析
+            content = safe_file_read(self.template_dir / "templates.json", encoding=None)
             if content:
-                self.templates = json.loads(content)
+                self.templates = orjson.loads(content)
+                self.clear_cache()
+                self.compile_all()
         except Exception as e:
             logger.error(f"加载模板文件失败: {str(e)}")
     
     def get_template(self, name: str) -> Optional[Template]:
         """获取指定名称的模板"""
-        template_str = self.templates.get(name)
-        return self.env.from_string(template_str) if template_str else None
+        template = self._compiled.get(name)
+        if template is None:
+            template_str = self.templates.get(name)
+            if not template_str:
+                return None
+            template = self._compiled[name] = self.env.from_string(template_str)
+        return template
+    
+    def compile_all(self) -> None:
+        """预先编译所有模板，避免首次渲染时承担编译开销"""
+        for name in self.templates:
+            try:
+                self.get_template(name)
+            except Exception as e:
+                logger.error(f"编译模板 {name} 失败: {str(e)}")
+    
+    def clear_cache(self) -> None:
+        """清除已编译模板和渲染结果缓存，模板内容变更后调用"""
+        self._compiled.clear()
+        self._render_cached.cache_clear()
     
     def render(self, template_name: str, **kwargs) -> Optional[str]:
         """渲染指定模板"""
+        try:
+            return self._render_cached(template_name, tuple(sorted(kwargs.items())))
+        except TypeError:
+            # 参数不可哈希时直接渲染
+            return self.render_uncached(template_name, **kwargs)
+    
+    def render_uncached(self, template_name: str, **kwargs) -> Optional[str]:
+        """渲染指定模板但不写入渲染缓存，用于参数每次都不同的大段内容"""
+        return self._render(template_name, tuple(kwargs.items()))
+    
+    def _render(self, template_name: str, items: Tuple[Tuple[str, Any], ...]) -> Optional[str]:
+        """渲染指定模板（不使用缓存）"""
+        kwargs = dict(items)
         template = self.get_template(template_name)
         try:
             return template.render(**kwargs) if template else None
@@ -42,7 +82,10 @@ class PromptTemplate:
     def add_template(self, name: str, template: str) -> bool:
         """添加新模板"""
         try:
+            # 新增时即编译，只使已缓存的渲染结果失效
+            self._compiled[name] = self.env.from_string(template)
             self.templates[name] = template
+            self._render_cached.cache_clear()
             return True
         except Exception as e:
             logger.error(f"添加模板失败: {str(e)}")
@@ -54,8 +97,21 @@ class PromptTemplate:
             self.template_dir.mkdir(parents=True, exist_ok=True)
             return safe_file_write(
                 self.template_dir / "templates.json",
-                json.dumps(self.templates, ensure_ascii=False, indent=2)
+                orjson.dumps(self.templates, option=orjson.OPT_INDENT_2),
+                mode="wb"
             )
         except Exception as e:
             logger.error(f"保存模板失败: {str(e)}")
             return False
+
+# 默认模板目录
+DEFAULT_TEMPLATE_DIR = str(settings.BASE_DIR / "resources/prompts")
+
+def get_prompt_template(template_dir: Optional[str] = None) -> PromptTemplate:
+    """获取指定目录的共享模板管理器，避免重复加载和编译模板"""
+    return _get_prompt_template(template_dir or DEFAULT_TEMPLATE_DIR)
+
+@functools.lru_cache(maxsize=None)
+def _get_prompt_template(template_dir: str) -> PromptTemplate:
+    """按目录缓存模板管理器"""
+    return PromptTemplate(template_dir)
@@ -0,0 +1,116 @@
+"""
+LLM响应缓存
+"""
+
+from typing import Any, Dict, List, Optional
+from cachetools import TTLCache
+from src.utils.common import extract_json_block
+import hashlib
+import orjson
+import os
+import threading
+
+# 参与缓存键计算的消息字段，其余字段（id、additional_kwargs等）每轮都可能变化
+STABLE_MESSAGE_FIELDS = ("role", "content", "images")
+
+def strip_message_metadata(messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """去除消息中的易变元数据，只保留影响响应内容的字段
+    
+    Args:
+        messages: 消息列表
+        
+    Returns:
+        List[Dict[str, Any]]: 只包含稳定字段的消息列表
+    """
+    return [
+        {field: msg[field] for field in STABLE_MESSAGE_FIELDS if field in msg}
+        for msg in messages
+    ]
+
+def file_fingerprints(paths: List[str]) -> List[Any]:
+    """获取文件指纹（路径、大小、修改时间），用于区分同名但内容已变化的文件
+    
+    Args:
+        paths: 文件路径列表
+        
+    Returns:
+        List[Any]: 文件指纹列表，文件不可访问时只保留路径
+    """
+    fingerprints = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+            fingerprints.append((path, stat.st_size, stat.st_mtime_ns))
+        except OSError:
+            fingerprints.append(path)
+    return fingerprints
+
+def is_json_response(response: Optional[str]) -> bool:
+    """判断响应是否为可解析的JSON（允许包裹在```json代码块中）
+    
+    用作写入缓存前的默认校验，避免格式错误或被截断的响应在过期前被反复返回。
+    
+    Args:
+        response: 响应内容
+        
+    Returns:
+        bool: 是否可解析
+    """
+    if not response:
+        return False
+    try:
+        orjson.loads(extract_json_block(response) or response)
+        return True
+    except orjson.JSONDecodeError:
+        return False
+
+class ResponseCache:
+    """线程安全的LLM响应缓存（LRU + 过期时间）"""
+    
+    def __init__(self, maxsize: int = 512, ttl: int = 3600):
+        """初始化响应缓存
+        
+        Args:
+            maxsize: 最大缓存条目数
+            ttl: 缓存过期时间(秒)
+        """
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._lock = threading.Lock()
+    
+    @staticmethod
+    def make_key(messages: List[Dict[str, Any]], **kwargs) -> str:
+        """根据消息列表和请求参数生成缓存键
+        
+        Args:
+            messages: 消息列表
+            **kwargs: 影响响应内容的其他参数
+            
+        Returns:
+            str: 缓存键
+        """
+        payload = orjson.dumps(
+            {"messages": strip_message_metadata(messages), **kwargs},
+            option=orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS,
+            default=str
+        )
+        return hashlib.blake2b(payload).hexdigest()
+    
+    def get(self, key: str) -> Optional[str]:
+        """获取缓存的响应"""
+        with self._lock:
+            return self._cache.get(key)
+    
+    def set(self, key: str, value: str) -> None:
+        """写入响应到缓存"""
+        with self._lock:
+            self._cache[key] = value
+    
+    def clear(self) -> None:
+        """清空缓存"""
+        with self._lock:
+            self._cache.clear()
+
+# 全局响应缓存实例
+response_cache = ResponseCache()
+
+__all__ = ["ResponseCache", "response_cache", "strip_message_metadata", "file_fingerprints", "is_json_response"]
@@ -0,0 +1,115 @@
+"""
+语义响应缓存
+"""
+
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from collections import deque
+from cachetools import LRUCache
+from .response_cache import ResponseCache
+from src.config.settings import settings
+import math
+import threading
+
+def normalize_vector(vector: Sequence[float]) -> Tuple[float, ...]:
+    """将向量归一化为单位向量，归一化后余弦相似度即为点积
+
+    Args:
+        vector: 原始向量
+
+    Returns:
+        Tuple[float, ...]: 单位向量
+    """
+    norm = math.sqrt(sum(value * value for value in vector))
+    if not norm:
+        return tuple(vector)
+    return tuple(value / norm for value in vector)
+
+class SemanticCache:
+    """基于向量相似度的响应缓存
+
+    缓存按上下文（历史消息等）分区，只有上下文完全一致且问题语义足够接近时才命中，
+    避免语义相近但上下文不同的问题返回错误的回复。
+    """
+
+    def __init__(
+        self,
+        threshold: float = 0.95,
+        max_contexts: int = 256,
+        max_entries_per_context: int = 32
+    ):
+        """初始化语义缓存
+
+        Args:
+            threshold: 命中所需的最小余弦相似度
+            max_contexts: 最大上下文分区数
+            max_entries_per_context: 每个上下文分区的最大条目数
+        """
+        self.threshold = threshold
+        self.max_entries_per_context = max_entries_per_context
+        self._contexts: LRUCache = LRUCache(maxsize=max_contexts)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_context_key(context: List[Dict[str, Any]], **kwargs) -> str:
+        """根据上下文消息生成分区键
+
+        Args:
+            context: 上下文消息列表
+            **kwargs: 影响响应内容的其他参数
+
+        Returns:
+            str: 分区键
+        """
+        return ResponseCache.make_key(context, **kwargs)
+
+    def get(self, context_key: str, embedding: Sequence[float]) -> Optional[str]:
+        """查找语义相近的缓存回复
+
+        Args:
+            context_key: 上下文分区键
+            embedding: 问题的向量表示
+
+        Returns:
+            Optional[str]: 相似度最高且超过阈值的缓存回复
+        """
+        query = normalize_vector(embedding)
+        with self._lock:
+            entries = self._contexts.get(context_key)
+            if not entries:
+                return None
+            entries = list(entries)
+
+        best_score = self.threshold
+        best_reply = None
+        for vector, reply in entries:
+            score = sum(a * b for a, b in zip(query, vector))
+            if score >= best_score:
+                best_score = score
+                best_reply = reply
+        return best_reply
+
+    def set(self, context_key: str, embedding: Sequence[float], reply: str) -> None:
+        """写入缓存回复
+
+        Args:
+            context_key: 上下文分区键
+            embedding: 问题的向量表示
+            reply: 回复内容
+        """
+        vector = normalize_vector(embedding)
+        with self._lock:
+            entries = self._contexts.get(context_key)
+            if entries is None:
+                entries = deque(maxlen=self.max_entries_per_context)
+                self._contexts[context_key] = entries
+            entries.append((vector, reply))
+
+    def clear(self) -> None:
+        """清空缓存"""
+        with self._lock:
+            self._contexts.clear()
+
+# 全局语义缓存实例
+semantic_cache = SemanticCache(threshold=settings.ai.AI_SEMANTIC_CACHE_THRESHOLD)
+
+__all__ = ["SemanticCache", "semantic_cache", "normalize_vector"]
@@ -1,30 +1,203 @@
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, AsyncIterator, Tuple, Callable
 from langchain_community.chat_models import ChatZhipuAI
 from langchain_core.messages import HumanMessage, AIMessage, SystemMessage
+from langchain_core.load import dumpd
+from langchain_core.outputs import ChatGeneration, LLMResult
+from langchain_core.runnables.config import get_async_callback_manager_for_config
 from src.config.settings import settings
 from src.logger.logger import logger
-from src.utils.decorators import handle_exceptions, retry
-from src.utils.common import process_multimodal_content, safe_json_loads
+from src.utils.common import process_multimodal_content, safe_orjson_loads, extract_json_block, JsonBoundaryScanner
 from src.storage.storage import get_storage_service
-from .prompt_template import PromptTemplate
+from .prompt_template import get_prompt_template
+from .response_cache import response_cache, is_json_response
+from cachetools import LRUCache
 import base64
-import json
+import hashlib
+import jwt
+import orjson
 import httpx
 from src.api.services.task import TaskManager
 import aiohttp
 import asyncio
+import contextlib
+import functools
+import os
+import threading
+import time
 import uuid
+import weakref
 from sqlalchemy import select
 from src.db.session import AsyncSessionLocal
 from src.api.models.task import Task
 
+# 智谱向量接口地址
+ZHIPU_EMBEDDING_URL = "https://open.bigmodel.cn/api/paas/v4/embeddings"
+
+# 图片编码缓存容量（按编码后字符数计）
+IMAGE_CACHE_MAX_SIZE = 128 * 1024 * 1024
+
+# 图片分块编码的块大小，须为3的倍数，保证各块的base64结果可直接拼接
+IMAGE_ENCODE_CHUNK_SIZE = 3 * 256 * 1024
+
+class TruncatedResponseError(ValueError):
+    """流式JSON响应在顶层对象闭合前结束（如达到最大token数）"""
+
+# 图片文件头签名与MIME类型
+IMAGE_MIME_SIGNATURES = (
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+    (b"BM", "image/bmp"),
+)
+
+def detect_image_mime(header: bytes, default: str = "image/jpeg") -> str:
+    """根据文件头识别图片的MIME类型
+    
+    Args:
+        header: 文件开头的字节
+        default: 无法识别时使用的类型
+        
+    Returns:
+        str: MIME类型
+    """
+    if header[:4] == b"RIFF" and header[8:12] == b"WEBP":
+        return "image/webp"
+    for signature, mime in IMAGE_MIME_SIGNATURES:
+        if header.startswith(signature):
+            return mime
+    return default
+
+# 消息角色对应的LangChain消息类型
+_MESSAGE_CLASS_BY_ROLE = {
+    "system": SystemMessage,
+    "user": HumanMessage,
+    "assistant": AIMessage
+}
+
+# 进程内共享的图片base64编码缓存，按(路径, 大小, 修改时间)索引
+_image_cache: LRUCache = LRUCache(maxsize=IMAGE_CACHE_MAX_SIZE, getsizeof=len)
+_image_cache_lock = threading.Lock()
+
+# 响应JSON提取结果缓存容量
+PARSE_CACHE_MAX_SIZE = 512
+
+@functools.lru_cache(maxsize=PARSE_CACHE_MAX_SIZE)
+def _extract_json_cached(response: str) -> str:
+    """提取响应文本中的JSON，相同文本（如重试、重复记录）直接复用上次的提取结果
+    
+    只缓存不可变的文本，每次调用重新解析，避免调用方之间共享可变对象。
+    """
+    return extract_json_block(response) or response
+
+# 鉴权token有效期(秒)
+AUTH_TOKEN_TTL_SECONDS = 3 * 60
+
+def _zhipu_auth_token(api_key: str) -> str:
+    """根据API密钥生成智谱接口的JWT鉴权token
+    
+    与langchain_community中ChatZhipuAI的私有实现保持一致，本地实现以免依赖其私有函数。
+    
+    Args:
+        api_key: 形如"{id}.{secret}"的API密钥
+        
+    Returns:
+        str: JWT token
+        
+    Raises:
+        ValueError: API密钥格式错误
+    """
+    try:
+        key_id, secret = api_key.split(".")
+    except ValueError as e:
+        raise ValueError("API密钥格式错误") from e
+    
+    now = int(round(time.time() * 1000))
+    return jwt.encode(
+        {"api_key": key_id, "exp": now + AUTH_TOKEN_TTL_SECONDS * 1000, "timestamp": now},
+        secret,
+        algorithm="HS256",
+        headers={"alg": "HS256", "sign_type": "SIGN"}
+    )
+
+def _clamp_sampling_params(payload: Dict[str, Any]) -> None:
+    """将temperature和top_p限制在[0.01, 0.99]，智谱接口只接受(0, 1)开区间内的值
+    
+    Args:
+        payload: 请求体，原地修改
+    """
+    for name in ("temperature", "top_p"):
+        value = payload.get(name)
+        if value is not None:
+            payload[name] = max(0.01, min(0.99, value))
+
+# 按事件循环共享的HTTP客户端，复用TCP/TLS连接
+# 连接和HTTP/2状态绑定在创建它们的事件循环上，不能跨循环（如应用主循环和任务后台循环）复用
+_http_clients = weakref.WeakKeyDictionary()
+_http_clients_lock = threading.Lock()
+
+def get_http_client() -> httpx.AsyncClient:
+    """获取当前事件循环的共享HTTP客户端实例，须在协程中调用"""
+    loop = asyncio.get_running_loop()
+    with _http_clients_lock:
+        client = _http_clients.get(loop)
+        if client is None or client.is_closed:
+            # HTTP/2在少量连接上多路复用并发请求，保留更多空闲连接，避免突发并发后频繁重连
+            client = httpx.AsyncClient(
+                limits=httpx.Limits(max_keepalive_connections=64, max_connections=128),
+                http2=True,
+                timeout=60
+            )
+            _http_clients[loop] = client
+    return client
+
+async def close_http_client() -> None:
+    """关闭当前事件循环的共享HTTP客户端，须在创建该客户端的事件循环中调用"""
+    with _http_clients_lock:
+        client = _http_clients.pop(asyncio.get_running_loop(), None)
+    if client is not None and not client.is_closed:
+        await client.aclose()
+
+class PooledChatZhipuAI(ChatZhipuAI):
+    """使用共享连接池发送非流式请求的ChatZhipuAI
+    
+    ChatZhipuAI未提供传入HTTP客户端的接口，因此覆盖_agenerate；其依赖的消息构造和
+    结果解析方法随langchain-community版本变化，requirements.txt中固定了其版本范围。
+    """
+    
+    async def _agenerate(self, messages, stop=None, run_manager=None, stream=None, **kwargs):
+        should_stream = stream if stream is not None else self.streaming
+        if should_stream:
+            return await super()._agenerate(
+                messages, stop=stop, run_manager=run_manager, stream=stream, **kwargs
+            )
+        
+        if self.zhipuai_api_key is None:
+            raise ValueError("Did not find zhipuai_api_key.")
+        
+        message_dicts, params = self._create_message_dicts(messages, stop)
+        payload = {**params, **kwargs, "messages": message_dicts, "stream": False}
+        _clamp_sampling_params(payload)
+        headers = {
+            "Authorization": _zhipu_auth_token(self.zhipuai_api_key),
+            "Accept": "application/json",
+        }
+        response = await get_http_client().post(
+            self.zhipuai_api_base,
+            json=payload,
+            headers=headers,
+            timeout=self.request_timeout or 60
+        )
+        response.raise_for_status()
+        return self._create_chat_result(response.json())
+
 class ZhipuAI:
     """智谱AI API封装"""
     
     def __init__(self):
         """初始化智谱AI客户端"""
         # 通用对话模型
-        self.chat_model = ChatZhipuAI(
+        self.chat_model = PooledChatZhipuAI(
             api_key=settings.ai.AI_ZHIPU_API_KEY,
             model_name=settings.ai.AI_ZHIPU_MODEL_CHAT,
             temperature=0.2,
@@ -33,7 +206,7 @@ class ZhipuAI:
         )
         
         # 多模态模型
-        self.vision_model = ChatZhipuAI(
+        self.vision_model = PooledChatZhipuAI(
             api_key=settings.ai.AI_ZHIPU_API_KEY,
             model_name=settings.ai.AI_ZHIPU_MODEL_VISION,
             temperature=0.2,
@@ -41,53 +214,124 @@ class ZhipuAI:
             streaming=False
         )
         
-        self.prompt_template = PromptTemplate()
+        self.prompt_template = get_prompt_template()
+        
+        # 启用对象存储时图片路径即为可访问的URL，直接传给模型，无需读取和编码
+        storage_service = get_storage_service()
+        self.use_image_urls = bool(storage_service and storage_service.enabled)
         logger.info(f"初始化AI客户端完成，对话模型: {settings.ai.AI_ZHIPU_MODEL_CHAT}, 视觉模型: {settings.ai.AI_ZHIPU_MODEL_VISION}")
     
+    def parse_response(self, response: str) -> Any:
+        """解析模型响应中的JSON内容，支持```json代码块中的对象或数组
+        
+        Args:
+            response: 模型响应文本
+            
+        Returns:
+            Any: 解析后的JSON数据
+            
+        Raises:
+            ValueError: 响应中没有有效的JSON
+        """
+        result = safe_orjson_loads(_extract_json_cached(response))
+        if result is None:
+            raise ValueError("响应中没有有效的JSON")
+        return result
+    
     def _convert_messages(self, messages: List[Dict[str, Any]]) -> List[Any]:
-        """转换消息格式为LangChain格式"""
-        message_map = {
-            "system": SystemMessage,
-            "user": HumanMessage,
-            "assistant": AIMessage
-        }
-        return [message_map[msg["role"]](content=msg["content"]) 
-                for msg in messages if msg["role"] in message_map]
+        """转换消息格式为LangChain格式，忽略未知角色的消息"""
+        return [
+            message_class(content=msg["content"])
+            for msg in messages
+            if (message_class := _MESSAGE_CLASS_BY_ROLE.get(msg["role"]))
+        ]
     
     def _process_image(self, path: str) -> Optional[Dict[str, Any]]:
         """处理图片内容"""
-        storage_service = get_storage_service()
-        if storage_service and storage_service.enabled:
+        if self.use_image_urls:
             return {
                 "type": "image_url",
                 "image_url": {"url": path}
             }
         
         try:
-            with open(path, 'rb') as f:
-                image_data = f.read()
-                if len(image_data) > settings.ai.AI_MAX_IMAGE_SIZE:
+            # 同一文件未修改时直接复用已编码的内容
+            stat = os.stat(path)
+            cache_key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+            with _image_cache_lock:
+                image_url = _image_cache.get(cache_key)
+            
+            if image_url is None:
+                # 根据文件大小提前过滤，过大的图片无需读取
+                if stat.st_size > settings.ai.AI_MAX_IMAGE_SIZE:
                     logger.warning(f"图片过大: {path}")
                     return None
-                    
-                base64_image = base64.b64encode(image_data).decode()
-                return {
-                    "type": "image_url",
-                    "image_url": {
-                        "url": f"data:image/jpeg;base64,{base64_image}"
-                    }
+                
+                # 分块编码并直接追加到URL缓冲区，避免同时持有完整原始数据和编码结果
+                with open(path, 'rb') as f:
+                    chunk = f.read(IMAGE_ENCODE_CHUNK_SIZE)
+                    buffer = bytearray(f"data:{detect_image_mime(chunk)};base64,".encode())
+                    while chunk:
+                        buffer += base64.b64encode(chunk)
+                        chunk = f.read(IMAGE_ENCODE_CHUNK_SIZE)
+                image_url = buffer.decode("ascii")
+                with _image_cache_lock:
+                    _image_cache[cache_key] = image_url
+            
+            return {
+                "type": "image_url",
+                "image_url": {
+                    "url": image_url
                 }
+            }
         except Exception as e:
             logger.error(f"处理图片失败: {path}, 错误: {str(e)}")
             return None
     
-    @retry(
-        max_retries=5,
-        delay=10,
-        backoff=2,
-        exceptions=(httpx.ReadTimeout, httpx.ConnectTimeout, httpx.TimeoutException)
-    )
-    @handle_exceptions(default_return=None)
+    def _prepare_image(self, path: str) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+        """处理图片内容并计算内容摘要
+        
+        Args:
+            path: 图片路径
+            
+        Returns:
+            Tuple[Optional[Dict[str, Any]], Optional[str]]: 图片消息内容和内容摘要，处理失败时均为None
+        """
+        image_content = self._process_image(path)
+        if not image_content:
+            return None, None
+        # 摘要基于图片URL（本地图片为包含全部内容的data URL），同名文件内容变化时摘要随之变化
+        digest = hashlib.blake2b(image_content["image_url"]["url"].encode()).hexdigest()
+        return image_content, digest
+    
+    async def embed(self, text: str, timeout: Optional[int] = None) -> Optional[List[float]]:
+        """获取文本的向量表示
+        
+        Args:
+            text: 文本内容
+            timeout: 超时时间（秒）
+            
+        Returns:
+            Optional[List[float]]: 向量，失败时返回None
+        """
+        try:
+            response = await get_http_client().post(
+                ZHIPU_EMBEDDING_URL,
+                json={"model": settings.ai.AI_ZHIPU_MODEL_EMBEDDING, "input": text},
+                headers={
+                    "Authorization": _zhipu_auth_token(self.chat_model.zhipuai_api_key),
+                    "Accept": "application/json",
+                },
+                timeout=timeout or 30
+            )
+            response.raise_for_status()
+            data = orjson.loads(response.content).get("data") or []
+            return data[0]["embedding"] if data else None
+            
+        except Exception as e:
+            logger.warning(f"获取向量失败: {str(e)}")
+            return None
+    
     async def chat(
         self,
         messages: List[Dict[str, str]],
@@ -107,14 +351,14 @@ class ZhipuAI:
             Optional[str]: 响应内容
         """
         try:
-            logger.info("发送聊天请求 (尝试 1/3)")
+            logger.info("发送聊天请求")
             
             # 转换消息格式
             langchain_messages = self._convert_messages(messages)
             
             # 添加JSON格式要求
             if response_format and response_format.get("type") == "json_object":
-                langchain_messages.insert(0, SystemMessage(content="请以JSON格式返回响应"))
+                langchain_messages = [SystemMessage(content="请以JSON格式返回响应"), *langchain_messages]
             
             # 设置超时时间
             if timeout:
@@ -126,7 +370,7 @@ class ZhipuAI:
                     pool=30.0
                 )
                 # 创建新的模型实例
-                chat_model = ChatZhipuAI(
+                chat_model = PooledChatZhipuAI(
                     api_key=settings.ai.AI_ZHIPU_API_KEY,
                     model_name=settings.ai.AI_ZHIPU_MODEL_CHAT,
                     temperature=0.2,
@@ -138,7 +382,7 @@ class ZhipuAI:
                     tags=config.get("tags", ["testboom"]) if config else None
                 )
             else:
-                chat_model = ChatZhipuAI(
+                chat_model = PooledChatZhipuAI(
                     api_key=settings.ai.AI_ZHIPU_API_KEY,
                     model_name=settings.ai.AI_ZHIPU_MODEL_CHAT,
                     temperature=0.2,
@@ -182,108 +426,353 @@ class ZhipuAI:
                     if hasattr(e, attr):
                         error_info[attr] = getattr(e, attr)
                 if error_info:
-                    logger.error(f"错误详情: {json.dumps(error_info, ensure_ascii=False)}")
+                    logger.error("错误详情: {}", orjson.dumps(error_info, default=str).decode())
                 return None
                 
         except Exception as e:
             logger.error(f"外部错误: {str(e)}", exc_info=True)
             return None
     
-    @retry(
-        max_retries=5,  # 增加重试次数
-        delay=10,       # 增加延迟时间
-        backoff=2,      # 保持指数退避
-        exceptions=(httpx.ReadTimeout, httpx.ConnectTimeout, httpx.TimeoutException)
-    )
-    @handle_exceptions(default_return=None)
+    async def chat_stream(
+        self,
+        messages: List[Dict[str, str]],
+        response_format: Optional[Dict[str, str]] = None,
+        timeout: Optional[int] = None,
+        config: Optional[Dict[str, Any]] = None
+    ) -> AsyncIterator[str]:
+        """以流式方式发送聊天请求
+        
+        Args:
+            messages: 消息列表
+            response_format: 响应格式
+            timeout: 超时时间（秒）
+            config: 运行配置，提供时通过其中的回调记录本次运行（如LangSmith追踪）
+            
+        Yields:
+            str: 增量响应内容
+        """
+        langchain_messages = self._convert_messages(messages)
+        if response_format and response_format.get("type") == "json_object":
+            langchain_messages = [SystemMessage(content="请以JSON格式返回响应"), *langchain_messages]
+        
+        message_dicts, params = self.chat_model._create_message_dicts(langchain_messages, None)
+        payload = {**params, "messages": message_dicts, "stream": True}
+        if response_format:
+            payload["response_format"] = response_format
+        _clamp_sampling_params(payload)
+        headers = {
+            "Authorization": _zhipu_auth_token(self.chat_model.zhipuai_api_key),
+            "Accept": "text/event-stream",
+        }
+        
+        # 直接发送SSE请求不经过LangChain模型，需手动触发回调才能记录运行
+        run_manager = None
+        if config:
+            callback_manager = get_async_callback_manager_for_config(config)
+            run_managers = await callback_manager.on_chat_model_start(
+                dumpd(self.chat_model),
+                [langchain_messages],
+                name=config.get("run_name")
+            )
+            run_manager = run_managers[0]
+        
+        parts = []
+        error = None
+        try:
+            async with get_http_client().stream(
+                "POST",
+                self.chat_model.zhipuai_api_base,
+                json=payload,
+                headers=headers,
+                timeout=timeout or 60
+            ) as response:
+                response.raise_for_status()
+                async for line in response.aiter_lines():
+                    if not line.startswith("data:"):
+                        continue
+                    data = line[5:].strip()
+                    if data == "[DONE]":
+                        break
+                    try:
+                        chunk = orjson.loads(data)
+                    except orjson.JSONDecodeError:
+                        # 单行事件损坏时跳过，内容缺失会导致JSON未闭合，由调用方按截断重试
+                        logger.warning("跳过无法解析的SSE事件: {:.200}", data)
+                        continue
+                    if not isinstance(chunk, dict):
+                        continue
+                    choices = chunk.get("choices") or []
+                    if choices:
+                        delta = choices[0].get("delta", {}).get("content")
+                        if delta:
+                            parts.append(delta)
+                            yield delta
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            # 调用方提前结束接收（如JSON对象已闭合）时同样记录为正常结束
+            if run_manager is not None:
+                if error is not None:
+                    await run_manager.on_llm_error(error)
+                else:
+                    await run_manager.on_llm_end(LLMResult(
+                        generations=[[ChatGeneration(message=AIMessage(content="".join(parts)))]]
+                    ))
+    
+    async def chat_stream_json_chunks(
+        self,
+        messages: List[Dict[str, str]],
+        response_format: Optional[Dict[str, str]] = None,
+        timeout: Optional[int] = None,
+        config: Optional[Dict[str, Any]] = None
+    ) -> AsyncIterator[str]:
+        """流式接收JSON响应，从顶层对象起始处开始输出，对象闭合后立即结束
+        
+        Args:
+            messages: 消息列表
+            response_format: 响应格式
+            timeout: 超时时间（秒）
+            config: 运行配置
+            
+        Yields:
+            str: 增量响应内容
+            
+        Raises:
+            TruncatedResponseError: 响应在顶层对象闭合前结束
+        """
+        scanner = JsonBoundaryScanner()
+        async with contextlib.aclosing(
+            self.chat_stream(messages, response_format, timeout, config)
+        ) as stream:
+            async for delta in stream:
+                start = 0 if scanner.depth else delta.find("{")
+                if start < 0:
+                    continue
+                end = scanner.feed(delta, start)
+                if end >= 0:
+                    yield delta[start:end + 1]
+                    return
+                yield delta[start:]
+        
+        if scanner.depth:
+            raise TruncatedResponseError("JSON响应在对象闭合前结束，内容可能被截断")
+    
+    async def chat_stream_json(
+        self,
+        messages: List[Dict[str, str]],
+        response_format: Optional[Dict[str, str]] = None,
+        timeout: Optional[int] = None,
+        config: Optional[Dict[str, Any]] = None
+    ) -> Optional[str]:
+        """流式接收JSON响应，顶层对象闭合后立即返回，不再等待剩余内容
+        
+        Args:
+            messages: 消息列表
+            response_format: 响应格式
+            timeout: 超时时间（秒）
+            config: 运行配置
+            
+        Returns:
+            Optional[str]: 响应内容，请求失败或响应被截断时返回None
+        """
+        try:
+            parts = [
+                chunk async for chunk in
+                self.chat_stream_json_chunks(messages, response_format, timeout, config)
+            ]
+            return "".join(parts) or None
+            
+        except Exception as e:
+            logger.error(f"流式请求失败: {str(e)}", exc_info=True)
+            return None
+    
+    async def chat_cached(
+        self,
+        messages: List[Dict[str, str]],
+        response_format: Optional[Dict[str, str]] = None,
+        timeout: Optional[int] = None,
+        config: Optional[Dict[str, Any]] = None,
+        stream: bool = False,
+        validate: Optional[Callable[[str], bool]] = None
+    ) -> Optional[str]:
+        """发送聊天请求，相同输入直接返回缓存的响应
+        
+        仅缓存JSON格式的请求，其他请求直接透传到chat。响应通过校验后才写入缓存，
+        格式错误的响应不会被缓存，调用方重试时会重新发送请求。
+        
+        Args:
+            messages: 消息列表
+            response_format: 响应格式
+            timeout: 超时时间（秒）
+            config: 配置参数
+            stream: 是否以流式方式接收JSON响应
+            validate: 响应校验函数，默认只要求可解析为JSON
+            
+        Returns:
+            Optional[str]: 响应内容
+        """
+        if not response_format or response_format.get("type") != "json_object":
+            return await self.chat(messages, response_format, timeout, config)
+        
+        key = response_cache.make_key(messages, response_format=response_format)
+        cached = response_cache.get(key)
+        if cached is not None:
+            logger.info("命中响应缓存")
+            return cached
+        
+        if stream:
+            result = await self.chat_stream_json(messages, response_format, timeout, config)
+        else:
+            result = await self.chat(messages, response_format, timeout, config)
+        if result and (validate or is_json_response)(result):
+            response_cache.set(key, result)
+        return result
+    
     async def chat_with_images(
         self, 
         messages: List[Dict[str, Any]], 
         image_paths: List[str],
         task_id: Optional[str] = None,
-        config: Optional[Dict[str, Any]] = None  # 添加配置参数
+        config: Optional[Dict[str, Any]] = None,  # 添加配置参数
+        use_cache: bool = False
     ) -> Optional[str]:
-        """发送带图片的对话请求"""
+        """发送带图片的对话请求
+        
+        Args:
+            messages: 消息列表，第一条消息内容作为提示词
+            image_paths: 图片路径列表
+            task_id: 任务ID，用于更新进度
+            config: 运行配置
+            use_cache: 是否按图片内容缓存单张图片的分析结果
+            
+        Returns:
+            Optional[str]: 第一张成功分析的图片结果（JSON字符串）
+        """
         
         try:
             total_images = len(image_paths)
             logger.info(f"开始处理 {total_images} 张图片")
             
             prompt = messages[0]["content"] if messages else ""
-            processed_images = []
             
-            for index, path in enumerate(image_paths, 1):
-                logger.info(f"正在处理第 {index}/{total_images} 张图片: {path}")
-                
-                # 更新任务进度
-                if task_id:
+            # 在线程池中并发读取和编码全部图片，不阻塞事件循环
+            image_contents = await asyncio.gather(
+                *(asyncio.to_thread(self._prepare_image, path) for path in image_paths)
+            )
+            
+            # 同一请求的所有图片共用一个视觉模型实例，包含callbacks和tags
+            vision_model = PooledChatZhipuAI(
+                api_key=settings.ai.AI_ZHIPU_API_KEY,
+                model_name=settings.ai.AI_ZHIPU_MODEL_VISION,
+                temperature=0.2,
+                top_p=0.2,
+                streaming=False,
+                callbacks=config.get("callbacks", []) if config else None,
+                tags=config.get("tags", ["testboom", "vision"]) if config else None
+            )
+            
+            semaphore = asyncio.Semaphore(settings.ai.AI_MAX_CONCURRENCY)
+            progress_lock = asyncio.Lock()
+            completed = 0
+            
+            async def update_progress() -> None:
+                """按完成数量更新任务进度"""
+                nonlocal completed
+                async with progress_lock:
+                    completed += 1
+                    if not task_id:
+                        return
                     try:
-                        progress_msg = f"{self.vision_model.model_name}正在处理第 {index}/{total_images} 张图片"
-                        logger.debug(f"更新任务进度 - TaskID: {task_id}, Progress: {progress_msg}")
+                        progress_msg = f"{self.vision_model.model_name}已处理 {completed}/{total_images} 张图片"
+                        logger.debug("更新任务进度 - TaskID: {}, Progress: {}", task_id, progress_msg)
                         
                         await TaskManager.update_task(
                             task_id,
                             result={
                                 'progress': progress_msg,
-                                'current': index,
+                                'current': completed,
                                 'total': total_images
                             }
                         )
                     except Exception as e:
                         logger.error(f"更新任务进度失败: {str(e)}")
-                
-                image_content = self._process_image(path)
-                if not image_content:
-                    logger.warning(f"跳过处理失败的图片: {path}")
-                    continue
-                    
-                # 构建多模态消息内容
-                multimodal_content = [
-                    {
-                        "type": "text",
-                        "text": prompt
-                    },
-                    image_content
-                ]
-                
-                logger.debug(f"发送图片分析请求: {path}")
+            
+            async def analyze_one(index: int, path: str, prepared: Tuple[Optional[Dict[str, Any]], Optional[str]]) -> Optional[Dict[str, Any]]:
+                """分析单张图片，失败时返回None，超时异常向上抛出"""
+                image_content, digest = prepared
                 try:
-                    # 创建新的vision_model实例，包含callbacks和tags
-                    vision_model = ChatZhipuAI(
-                        api_key=settings.ai.AI_ZHIPU_API_KEY,
-                        model_name=settings.ai.AI_ZHIPU_MODEL_VISION,
-                        temperature=0.2,
-                        top_p=0.2,
-                        streaming=False,
-                        callbacks=config.get("callbacks", []) if config else None,
-                        tags=config.get("tags", ["testboom", "vision"]) if config else None
-                    )
+                    if not image_content:
+                        logger.warning(f"跳过处理失败的图片: {path}")
+                        return None
                     
-                    # 使用vision_model处理请求
-                    response = await vision_model.ainvoke(
-                        [HumanMessage(content=multimodal_content)],
-                        response_format={"type": "json_object"},
-                        config=config  # 添加配置
-                    )
+                    # 相同提示词和图片内容直接复用已缓存的分析结果
+                    key = None
+                    if use_cache:
+                        key = response_cache.make_key(
+                            [{"role": "user", "content": prompt}],
+                            model=settings.ai.AI_ZHIPU_MODEL_VISION,
+                            image=digest
+                        )
+                        cached = response_cache.get(key)
+                        if cached is not None:
+                            logger.info(f"命中图片分析缓存: {path}")
+                            return safe_orjson_loads(cached)
+                    
+                    # 构建多模态消息内容
+                    multimodal_content = [
+                        {
+                            "type": "text",
+                            "text": prompt
+                        },
+                        image_content
+                    ]
+                    
+                    async with semaphore:
+                        logger.info(f"正在处理第 {index}/{total_images} 张图片: {path}")
+                        response = await vision_model.ainvoke(
+                            [HumanMessage(content=multimodal_content)],
+                            response_format={"type": "json_object"},
+                            config=config  # 添加配置
+                        )
                     
                     result = response.content if isinstance(response, AIMessage) else response
-                    if result:
-                        logger.debug(f"收到模型响应:\n{result}")
-                        parsed_result = safe_json_loads(result)
-                        if parsed_result:
-                            logger.debug(f"解析结果成功:\n{json.dumps(parsed_result, ensure_ascii=False, indent=2)}")
-                            processed_images.append(parsed_result)
-                        else:
-                            logger.warning(f"解析响应失败: {result}")
-                    else:
+                    if not result:
                         logger.warning("模型未返回有效响应")
-                        
+                        return None
+                    
+                    logger.debug("收到模型响应:\n{}", result)
+                    parsed_result = safe_orjson_loads(result)
+                    if not parsed_result:
+                        logger.warning(f"解析响应失败: {result}")
+                        return None
+                    
+                    logger.opt(lazy=True).debug("解析结果成功:\n{}", lambda: orjson.dumps(parsed_result, option=orjson.OPT_NON_STR_KEYS).decode())
+                    if key is not None:
+                        response_cache.set(key, result)
+                    return parsed_result
+                    
                 except (httpx.ReadTimeout, httpx.ConnectTimeout, httpx.TimeoutException) as e:
                     logger.error(f"处理图片 {path} 超时: {str(e)}")
                     raise
                 except Exception as e:
                     logger.error(f"处理图片 {path} 失败: {str(e)}")
-                    continue
+                    return None
+                finally:
+                    await update_progress()
+            
+            # 各图片请求相互独立，并发发送（受并发数限制），结果保持图片顺序
+            results = await asyncio.gather(
+                *(
+                    analyze_one(index, path, prepared)
+                    for index, (path, prepared) in enumerate(zip(image_paths, image_contents), 1)
+                ),
+                return_exceptions=True
+            )
+            for result in results:
+                if isinstance(result, BaseException):
+                    raise result
+            processed_images = [result for result in results if result]
             
             if not processed_images:
                 logger.error("没有成功处理任何图片")
@@ -292,7 +781,7 @@ class ZhipuAI:
             logger.info(f"成功处理 {len(processed_images)}/{total_images} 张图片")
             
             # 直接返回第一个结果
-            return json.dumps(processed_images[0], ensure_ascii=False)
+            return orjson.dumps(processed_images[0], option=orjson.OPT_NON_STR_KEYS).decode()
                 
         except (httpx.ReadTimeout, httpx.ConnectTimeout, httpx.TimeoutException) as e:
             logger.error(f"请求超时: {str(e)}")
@@ -300,3 +789,13 @@ class ZhipuAI:
         except Exception as e:
             logger.error(f"图片对话请求失败: {str(e)}")
             return None
+
+# 全局AI客户端实例
+_zhipu_ai: Optional[ZhipuAI] = None
+
+def get_zhipu_ai() -> ZhipuAI:
+    """获取AI客户端实例"""
+    global _zhipu_ai
+    if _zhipu_ai is None:
+        _zhipu_ai = ZhipuAI()
+    return _zhipu_ai
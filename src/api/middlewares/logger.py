@@ -5,7 +5,14 @@ import time
 from typing import Callable
 from fastapi.routing import APIRoute
 from starlette.responses import Response
-import json
+import orjson
+
+def _format_json_body(body: bytes) -> str:
+    """格式化JSON请求体用于日志输出"""
+    try:
+        return orjson.dumps(orjson.loads(body)).decode()
+    except orjson.JSONDecodeError:
+        return "<invalid JSON>"
 
 class LoggerMiddleware(BaseHTTPMiddleware):
     """日志中间件,用于记录请求和响应信息"""
@@ -26,23 +33,15 @@ class LoggerMiddleware(BaseHTTPMiddleware):
                 content_type = request.headers.get("content-type", "")
                 
                 # 根据内容类型处理请求体
+                # 仅在DEBUG级别启用时才解码和格式化请求体
                 if "application/json" in content_type:
-                    try:
-                        body_text = body.decode('utf-8')
-                        body_json = json.loads(body_text)
-                        logger.debug(f"Request body (JSON): {json.dumps(body_json, ensure_ascii=False)}")
-                    except json.JSONDecodeError:
-                        logger.warning("Failed to parse JSON request body")
+                    logger.opt(lazy=True).debug("Request body (JSON): {}", lambda: _format_json_body(body))
                 elif "multipart/form-data" in content_type:
                     logger.debug("Request contains form data (not logged)")
                 elif "application/x-www-form-urlencoded" in content_type:
-                    try:
-                        body_text = body.decode('utf-8')
-                        logger.debug(f"Request body (form): {body_text}")
-                    except UnicodeDecodeError:
-                        logger.warning("Failed to decode form data")
+                    logger.opt(lazy=True).debug("Request body (form): {}", lambda: body.decode('utf-8', errors='replace'))
                 else:
-                    logger.debug(f"Request body type: {content_type} (not logged)")
+                    logger.debug("Request body type: {} (not logged)", content_type)
         except Exception as e:
             logger.warning(f"Failed to process request body: {str(e)}")
             
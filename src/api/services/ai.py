@@ -1,6 +1,9 @@
 from typing import List, Dict, Any, Optional
 from loguru import logger
 from src.ai_core.chat_manager import ChatManager
+from src.config.settings import settings
+import asyncio
+import itertools
 
 class AIService:
     """AI服务"""
@@ -30,7 +33,7 @@ class AIService:
             
             # 使用ChatManager处理图片分析
             chat_manager = ChatManager()
-            response = chat_manager.chat_with_images(message, [image_path])
+            response = await chat_manager.chat_with_images(message, [image_path])
             if not response:
                 raise ValueError("AI分析失败")
             
@@ -54,9 +57,12 @@ class AIService:
         image_paths: List[str],
         module_name: Optional[str] = None
     ) -> List[Dict[str, Any]]:
-        """分析多张图片生成用例"""
-        all_cases = []
-        for image_path in image_paths:
-            cases = await cls.analyze_image(image_path, module_name)
-            all_cases.extend(cases)
-        return all_cases 
\ No newline at end of file
+        """分析多张图片生成用例（并发请求，按图片顺序合并结果）"""
+        semaphore = asyncio.Semaphore(settings.ai.AI_MAX_CONCURRENCY)
+        
+        async def analyze(image_path: str) -> List[Dict[str, Any]]:
+            async with semaphore:
+                return await cls.analyze_image(image_path, module_name)
+        
+        results = await asyncio.gather(*(analyze(image_path) for image_path in image_paths))
+        return list(itertools.chain.from_iterable(results))
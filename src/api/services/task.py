@@ -38,6 +38,32 @@ class TaskManager:
             )
             cls._background_thread.start()
     
+    @classmethod
+    async def shutdown(cls, timeout: float = 10) -> None:
+        """停止后台事件循环，先在该循环中关闭其HTTP客户端
+        
+        Args:
+            timeout: 等待关闭完成的超时时间(秒)
+        """
+        loop = cls._background_loop
+        if loop is None or not loop.is_running():
+            return
+        
+        # 延迟导入，避免与zhipu_api循环引用
+        from src.ai_core.zhipu_api import close_http_client
+        
+        try:
+            future = asyncio.run_coroutine_threadsafe(close_http_client(), loop)
+            await asyncio.wait_for(asyncio.wrap_future(future), timeout)
+        except Exception as e:
+            logger.error(f"关闭后台HTTP客户端失败: {str(e)}")
+        finally:
+            loop.call_soon_threadsafe(loop.stop)
+            if cls._background_thread is not None:
+                await asyncio.to_thread(cls._background_thread.join, timeout)
+            cls._background_thread = None
+            cls._background_loop = None
+    
     @classmethod
     def run_background_task(cls, task_id: str, coro: Callable, *args, **kwargs):
         """在后台运行任务
@@ -16,11 +16,18 @@ class AIConfig(BaseSettings):
     )
     AI_ZHIPU_MODEL_CHAT: str = Field("glm-4-flash", description="对话模型名称")
     AI_ZHIPU_MODEL_VISION: str = Field("glm-4v-flash", description="多模态模型名称")
+    AI_ZHIPU_MODEL_EMBEDDING: str = Field("embedding-2", description="向量模型名称")
     AI_MAX_TOKENS: int = Field(6000, description="最大token数")
+    AI_HISTORY_MAX_TOKENS: int = Field(16000, description="对话历史估算token数上限")
     AI_MAX_IMAGE_SIZE: int = Field(10 * 1024 * 1024, description="最大图片大小(bytes)")
     AI_RETRY_COUNT: int = Field(3, description="重试次数")
     AI_RETRY_DELAY: int = Field(5, description="重试延迟(秒)")
     AI_RETRY_BACKOFF: float = Field(2.0, description="重试延迟倍数")
+    AI_MAX_CONCURRENCY: int = Field(3, description="并发请求数上限")
+    AI_SEMANTIC_CACHE_ENABLED: bool = Field(False, description="是否启用对话语义缓存")
+    AI_SEMANTIC_CACHE_THRESHOLD: float = Field(0.95, description="语义缓存命中的最小相似度")
+    AI_CONTEXT_DEDUP: bool = Field(False, description="是否将请求中重复的上下文内容替换为引用标注")
+    AI_LOCAL_SUMMARY_MERGE: bool = Field(True, description="多图片分析结果结构一致且文本字段无冲突时在本地合并，不再请求模型汇总")
     
     # LangSmith配置
     LANGSMITH_API_KEY: str = Field("", description="LangSmith API密钥")
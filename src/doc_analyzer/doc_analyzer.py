@@ -28,7 +28,7 @@ class DocAnalyzer:
         self.file_processor = FileProcessor(str(self.work_dir))
         self.chat_manager = ChatManager()
     
-    def analyze_prd(self, zip_path: str) -> Optional[Dict[str, Any]]:
+    async def analyze_prd(self, zip_path: str) -> Optional[Dict[str, Any]]:
         """分析PRD文档
         
         Args:
@@ -59,7 +59,7 @@ class DocAnalyzer:
                     continue
                 
                 # 分析图片
-                result = self.chat_manager.chat_with_images(
+                result = await self.chat_manager.chat_with_images(
                     "请分析这张图片，提取所有对测试用例设计有帮助的信息。",
                     [str(image_path)]
                 )
@@ -80,14 +80,14 @@ class DocAnalyzer:
             
             # 生成汇总报告
             logger.info("\n开始生成汇总报告...")
-            summary = self.chat_manager.analyze_requirement(summary_content)
+            summary = await self.chat_manager.analyze_requirement(summary_content)
             if not summary:
                 logger.error("生成汇总报告失败")
                 return None
             
             # 生成测试用例
             logger.info("\n开始生成测试用例...")
-            testcases = self.chat_manager.generate_testcases(
+            testcases = await self.chat_manager.generate_testcases(
                 summary,
                 {'images': image_results}
             )
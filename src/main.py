@@ -10,6 +10,8 @@ from src.api.models.base import ResponseModel
 from src.api.routers import case, file, dashboard
 from src.api.services.file import FileService
 from src.db import init_db
+from src.ai_core.zhipu_api import close_http_client
+from src.api.services.task import TaskManager
 import os
 
 # 创建FastAPI应用实例
@@ -107,6 +109,15 @@ async def startup_event():
     os.makedirs(FileService.TEMP_DIR, exist_ok=True)
     logger.info(f"目录初始化完成: {FileService.UPLOAD_DIR}, {FileService.TEMP_DIR}")
 
+# 关闭事件
+@app.on_event("shutdown")
+async def shutdown_event():
+    """应用关闭时的事件处理"""
+    # 各事件循环的HTTP客户端分别在各自的循环中关闭
+    await TaskManager.shutdown()
+    await close_http_client()
+    logger.info("HTTP客户端已关闭")
+
 if __name__ == "__main__":
     # 标记为主进程
     os.environ["RELOAD_PROCESS"] = "0"
@@ -2,7 +2,17 @@ import os
 from pathlib import Path
 from typing import Union, List, Dict, Any, Optional
 from ..logger.logger import logger
-import json
+import orjson
+import re
+
+# Markdown代码块中的JSON对象或数组（仅在括号匹配失败时使用）
+JSON_FENCE_PATTERN = re.compile(r'```json\s*(\{.*?\}|\[.*?\])\s*```', re.DOTALL)
+# JSON对象或数组的起始字符
+JSON_START_PATTERN = re.compile(r'[{\[]')
+# 括号匹配时需要关注的字符
+JSON_SCAN_PATTERN = re.compile(r'[{}\[\]"\\]')
+# 以JSON对象开头（允许前导空白）
+JSON_OBJECT_START_PATTERN = re.compile(r'\s*\{')
 
 def ensure_dir(dir_path: Union[str, Path]) -> Path:
     """确保目录存在,如果不存在则创建"""
@@ -19,21 +29,23 @@ def list_files(directory: Union[str, Path], pattern: str = "*") -> List[Path]:
     path = Path(directory)
     return list(path.glob(pattern))
 
-def safe_file_write(file_path: Union[str, Path], content: str, mode: str = "w", encoding: str = "utf-8") -> bool:
-    """安全地写入文件内容"""
+def safe_file_write(file_path: Union[str, Path], content: Union[str, bytes], mode: str = "w", encoding: str = "utf-8") -> bool:
+    """安全地写入文件内容，mode包含b时写入bytes"""
     try:
         path = Path(file_path)
         ensure_dir(path.parent)
-        with open(path, mode=mode, encoding=encoding) as f:
+        with open(path, mode=mode, encoding=None if "b" in mode else encoding) as f:
             f.write(content)
         return True
     except Exception as e:
         logger.error(f"写入文件失败: {e}")
         return False
 
-def safe_file_read(file_path: Union[str, Path], encoding: str = "utf-8") -> Union[str, None]:
-    """安全地读取文件内容"""
+def safe_file_read(file_path: Union[str, Path], encoding: Optional[str] = "utf-8") -> Union[str, bytes, None]:
+    """安全地读取文件内容，encoding为None时返回bytes"""
     try:
+        if encoding is None:
+            return Path(file_path).read_bytes()
         with open(file_path, encoding=encoding) as f:
             return f.read()
     except Exception as e:
@@ -95,22 +107,98 @@ def process_multimodal_content(content: List[Dict[str, Any]], max_tokens: int) -
             
     return processed
 
-def safe_json_loads(text: str, default: Any = None) -> Any:
-    """安全的JSON解析
+def safe_orjson_loads(data: Union[str, bytes], default: Any = None) -> Any:
+    """基于orjson的安全JSON解析，可直接解析bytes
     
     Args:
-        text: JSON字符串
+        data: JSON字符串或字节串
         default: 解析失败时的默认值
         
     Returns:
         Any: 解析结果或默认值
     """
     try:
-        return json.loads(text)
-    except json.JSONDecodeError as e:
+        return orjson.loads(data)
+    except orjson.JSONDecodeError as e:
         logger.error(f"JSON解析失败: {str(e)}")
         return default
 
+# 兼容旧名称
+safe_json_loads = safe_orjson_loads
+
+class JsonBoundaryScanner:
+    """增量查找JSON对象或数组的结束位置
+    
+    只在括号、引号和反斜杠处停留，其余字符由正则引擎跳过。扫描状态（嵌套深度、
+    是否在字符串内、末尾的转义符）在多次feed之间保留，可用于逐段到达的流式文本。
+    """
+    
+    def __init__(self):
+        """初始化扫描状态"""
+        self.depth = 0
+        self.in_string = False
+        self._escape_pending = False
+    
+    def feed(self, text: str, start: int = 0) -> int:
+        """扫描一段文本
+        
+        Args:
+            text: 文本片段
+            start: 开始扫描的位置
+            
+        Returns:
+            int: 顶层结构闭合字符的下标，尚未闭合时返回-1
+        """
+        # 上一段以转义符结尾时，本段第一个字符被转义
+        escaped_index = start if self._escape_pending else -1
+        self._escape_pending = False
+        for match in JSON_SCAN_PATTERN.finditer(text, start):
+            index = match.start()
+            if index == escaped_index:
+                continue
+            char = match.group()
+            if self.in_string:
+                if char == "\\":
+                    escaped_index = index + 1
+                elif char == '"':
+                    self.in_string = False
+            elif char == '"':
+                self.in_string = True
+            elif char in "{[":
+                self.depth += 1
+            elif char in "}]":
+                self.depth -= 1
+                if self.depth == 0:
+                    return index
+        self._escape_pending = escaped_index == len(text)
+        return -1
+
+def extract_json_block(text: str) -> Optional[str]:
+    """从```json代码块中提取JSON对象或数组文本
+    
+    先通过括号匹配定位完整的对象或数组，避免正则回溯；括号不匹配时再退回正则。
+    
+    Args:
+        text: 模型返回的文本
+        
+    Returns:
+        Optional[str]: JSON对象或数组文本，未找到时返回None
+    """
+    fence = text.find("```json")
+    if fence < 0:
+        return None
+    match = JSON_START_PATTERN.search(text, fence + 7)
+    if not match:
+        return None
+    start = match.start()
+    
+    end = JsonBoundaryScanner().feed(text, start)
+    if end >= 0:
+        return text[start:end + 1]
+    
+    match = JSON_FENCE_PATTERN.search(text, fence)
+    return match.group(1) if match else None
+
 def ensure_directory(path: str) -> bool:
     """确保目录存在
     
@@ -93,4 +93,14 @@ class PlantUMLGenerator:
             
         except Exception as e:
             logger.error(f"生成时序图失败: {str(e)}")
-            return "" 
\ No newline at end of file
+            return ""
+
+# 全局PlantUML生成器实例（无状态，可安全复用）
+_plantuml_generator: Optional[PlantUMLGenerator] = None
+
+def get_plantuml_generator() -> PlantUMLGenerator:
+    """获取PlantUML生成器实例"""
+    global _plantuml_generator
+    if _plantuml_generator is None:
+        _plantuml_generator = PlantUMLGenerator()
+    return _plantuml_generator
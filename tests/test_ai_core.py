@@ -4,7 +4,8 @@ from pathlib import Path
 from src.ai_core.chat_manager import ChatManager
 from src.logger.logger import logger
 
-def test_chat_manager():
+@pytest.mark.asyncio
+async def test_chat_manager():
     """测试基本对话功能"""
     manager = ChatManager()
     
@@ -12,12 +13,13 @@ def test_chat_manager():
     question = "解释一下什么是自动化测试?"
     logger.info(f"\n提问: {question}")
     
-    reply = manager.chat(question)
+    reply = await manager.chat(question)
     assert reply is not None
     logger.info(f"\n回复: {reply}")
     assert len(manager.history) == 2  # user消息和assistant回复
 
-def test_chat_manager_with_image():
+@pytest.mark.asyncio
+async def test_chat_manager_with_image():
     """测试图片理解功能"""
     manager = ChatManager()
     
@@ -30,7 +32,7 @@ def test_chat_manager_with_image():
     logger.info(f"\n提问: {question}")
     logger.info(f"图片路径: {image_path}")
     
-    reply = manager.chat_with_images(question, [image_path])
+    reply = await manager.chat_with_images(question, [image_path])
     assert reply is not None
     logger.info(f"\n回复: {reply}")
     assert len(manager.history) == 2  # user消息和assistant回复
@@ -117,4 +119,110 @@ def test_testcase_analysis():
     logger.info("\n测试用例分析:")
     result = manager.analyze_testcases(testcases)
     assert result is not None
-    logger.info(f"\n分析结果:\n{result}")
\ No newline at end of file
+    logger.info(f"\n分析结果:\n{result}")
+
+def test_detect_image_mime():
+    """测试根据文件头识别图片类型"""
+    from src.ai_core.zhipu_api import detect_image_mime
+    
+    assert detect_image_mime(b"\x89PNG\r\n\x1a\n\x00\x00\x00\rIHDR") == "image/png"
+    assert detect_image_mime(b"\xff\xd8\xff\xe0\x00\x10JFIF") == "image/jpeg"
+    assert detect_image_mime(b"RIFF\x24\x00\x00\x00WEBPVP8 ") == "image/webp"
+    assert detect_image_mime(b"GIF89a\x01\x00") == "image/gif"
+    # 无法识别时使用默认类型
+    assert detect_image_mime(b"unknown") == "image/jpeg"
+
+def test_merge_analysis_results():
+    """测试多图片分析结果的本地合并"""
+    from src.ai_core.chat_manager import _merge_analysis_results
+    
+    first = {"需求背景": {"项目背景": "背景A", "业务目标": ["目标1", "目标2"]}}
+    second = {
+        "需求背景": {"项目背景": "背景A", "业务目标": ["目标2", "目标3"]},
+        "整体功能架构": {"系统模块": ["模块1"]}
+    }
+    assert _merge_analysis_results([first, second]) == {
+        "需求背景": {"项目背景": "背景A", "业务目标": ["目标1", "目标2", "目标3"]},
+        "整体功能架构": {"系统模块": ["模块1"]}
+    }
+    
+    # 空文本不影响合并
+    assert _merge_analysis_results([{"需求背景": {"项目背景": ""}}, first]) == first
+    
+    # 文本内容不同时交由模型汇总
+    assert _merge_analysis_results([first, {"需求背景": {"项目背景": "背景B"}}]) is None
+    
+    # 结构不一致时交由模型汇总
+    assert _merge_analysis_results([first, {"需求背景": "文本"}]) is None
+    assert _merge_analysis_results([first, {"需求背景": {"业务目标": [{"名称": "目标"}]}}]) is None
+
+def test_is_retriable():
+    """测试限流和服务端错误可重试，客户端错误不可重试"""
+    import httpx
+    from src.ai_core.chat_manager import _is_retriable
+    
+    request = httpx.Request("POST", "https://open.bigmodel.cn/api/paas/v4/chat/completions")
+    
+    def status_error(status_code: int) -> httpx.HTTPStatusError:
+        return httpx.HTTPStatusError(
+            "error", request=request, response=httpx.Response(status_code, request=request)
+        )
+    
+    assert _is_retriable(status_error(429))
+    assert _is_retriable(status_error(502))
+    assert _is_retriable(status_error(503))
+    assert not _is_retriable(status_error(400))
+    assert not _is_retriable(status_error(401))
+    assert _is_retriable(httpx.ConnectError("连接失败", request=request))
+    assert not _is_retriable(ValueError("格式错误"))
+
+def test_parse_response_array():
+    """测试解析代码块中的JSON数组，且每次返回独立的对象"""
+    from src.ai_core.zhipu_api import get_zhipu_ai
+    
+    ai = get_zhipu_ai()
+    response = '分析结果如下：\n```json\n[{"a": 1}, {"b": [2, "]"]}]\n```'
+    result = ai.parse_response(response)
+    assert result == [{"a": 1}, {"b": [2, "]"]}]
+    
+    # 修改返回结果不影响后续解析
+    result.append({"c": 3})
+    assert ai.parse_response(response) == [{"a": 1}, {"b": [2, "]"]}]
+    
+    with pytest.raises(ValueError):
+        ai.parse_response("没有JSON")
+
+def test_http_client_per_loop():
+    """测试每个事件循环使用独立的共享HTTP客户端"""
+    import asyncio
+    from src.ai_core.zhipu_api import get_http_client, close_http_client
+    
+    async def get_and_close():
+        client = get_http_client()
+        # 同一事件循环内复用同一客户端
+        assert get_http_client() is client
+        await close_http_client()
+        assert client.is_closed
+        return client
+    
+    # 不同事件循环各自创建客户端
+    assert asyncio.run(get_and_close()) is not asyncio.run(get_and_close())
+
+def test_zhipu_auth_helpers():
+    """测试本地实现的鉴权token生成和采样参数截断"""
+    import jwt
+    from src.ai_core.zhipu_api import _zhipu_auth_token, _clamp_sampling_params
+    
+    secret = "s" * 32
+    token = _zhipu_auth_token(f"key-id.{secret}")
+    assert jwt.get_unverified_header(token)["sign_type"] == "SIGN"
+    claims = jwt.decode(token, secret, algorithms=["HS256"], options={"verify_exp": False})
+    assert claims["api_key"] == "key-id"
+    assert claims["exp"] > claims["timestamp"]
+    
+    with pytest.raises(ValueError):
+        _zhipu_auth_token("invalid")
+    
+    payload = {"temperature": 0, "top_p": 1.0, "max_tokens": 10}
+    _clamp_sampling_params(payload)
+    assert payload == {"temperature": 0.01, "top_p": 0.99, "max_tokens": 10}
@@ -63,6 +63,27 @@ async def test_chat_with_json_response():
     assert response.strip().startswith("{")
     assert response.strip().endswith("}")
 
+@pytest.mark.asyncio
+async def test_chat_stream_json():
+    """测试流式JSON响应"""
+    chat_graph = ChatGraph()
+    
+    messages = [{
+        "role": "user",
+        "content": "生成一个测试用例JSON。"
+    }]
+    
+    chunks = [
+        chunk async for chunk in chat_graph.chat_stream(
+            messages=messages,
+            response_format={"type": "json_object"}
+        )
+    ]
+    
+    response = "".join(chunks)
+    assert response.startswith("{")
+    assert response.endswith("}")
+
 @pytest.mark.asyncio
 async def test_chat_with_timeout():
     """测试超时设置"""
@@ -159,6 +180,7 @@ if __name__ == "__main__":
     asyncio.run(test_chat_basic())
     asyncio.run(test_chat_with_template())
     asyncio.run(test_chat_with_json_response())
+    asyncio.run(test_chat_stream_json())
     asyncio.run(test_chat_with_timeout())
     asyncio.run(test_chat_with_error())
     asyncio.run(test_chat_with_system_message())
@@ -0,0 +1,29 @@
+from src.ai_core.dedup import dedup_messages
+
+def test_dedup_messages():
+    """测试上下文去重"""
+    block = "\n".join(f"功能点{i}: " + "统计使用情况" * 10 for i in range(400))
+    messages = [
+        {"role": "system", "content": "你是测试专家"},
+        {"role": "user", "content": block},
+        {"role": "assistant", "content": "{}"},
+        {"role": "user", "content": block},
+        {"role": "user", "content": "补充说明\n" + block}
+    ]
+    
+    result = dedup_messages(messages)
+    
+    # 原消息不被修改
+    assert messages[3]["content"] == block
+    
+    # 系统消息和首次出现的内容保持不变
+    assert result[0] == messages[0]
+    assert result[1]["content"] == block
+    
+    # 完全重复的消息替换为引用
+    assert result[3]["content"] == "[同第2条消息内容]"
+    
+    # 部分重复的长消息按块去重
+    assert result[4]["content"].startswith("补充说明")
+    assert len(result[4]["content"]) < len(messages[4]["content"])
+    assert "[同第2条消息中的内容]" in result[4]["content"]
@@ -4,7 +4,8 @@ from src.doc_analyzer.doc_analyzer import DocAnalyzer
 from src.logger.logger import logger
 from tests.test_base import log_test_step, verify_testcase_structure
 
-def test_doc_analyzer():
+@pytest.mark.asyncio
+async def test_doc_analyzer():
     """测试文档分析器
     
     测试流程:
@@ -20,7 +21,7 @@ def test_doc_analyzer():
     
     # 分析PRD
     log_test_step("开始分析PRD文档:")
-    result = analyzer.analyze_prd(zip_path)
+    result = await analyzer.analyze_prd(zip_path)
     
     # 验证基本结构
     assert result is not None
@@ -0,0 +1,99 @@
+"""
+测试JSON提取（代码块提取和流式JSON截取）
+"""
+
+import pytest
+import orjson
+from src.ai_core.zhipu_api import get_zhipu_ai, TruncatedResponseError
+from src.utils.common import extract_json_block, JsonBoundaryScanner
+
+def test_extract_json_block_nested():
+    """测试提取嵌套对象，忽略代码块前后的文本"""
+    text = '分析结果：\n```json\n{"a": {"b": {"c": [1, 2]}}, "d": {}}\n```\n以上。'
+    assert extract_json_block(text) == '{"a": {"b": {"c": [1, 2]}}, "d": {}}'
+
+def test_extract_json_block_braces_in_strings():
+    """测试字符串中的括号不影响匹配"""
+    text = '```json\n{"steps": "点击{按钮}后[确认]", "expected": "}"}\n```'
+    block = extract_json_block(text)
+    assert orjson.loads(block) == {"steps": "点击{按钮}后[确认]", "expected": "}"}
+
+def test_extract_json_block_escaped_quotes():
+    """测试转义引号和反斜杠不会提前结束字符串"""
+    text = '```json\n{"a": "他说\\"}\\"", "b": "C:\\\\", "c": 1}\n```'
+    block = extract_json_block(text)
+    assert orjson.loads(block) == {"a": '他说"}"', "b": "C:\\", "c": 1}
+
+def test_extract_json_block_array():
+    """测试提取代码块中的JSON数组"""
+    text = '```json\n[{"a": 1}, {"b": [2, "]"]}]\n```'
+    assert orjson.loads(extract_json_block(text)) == [{"a": 1}, {"b": [2, "]"]}]
+
+def test_extract_json_block_unterminated():
+    """测试未闭合的对象和缺少代码块时返回None"""
+    assert extract_json_block('```json\n{"a": {"b": 1}') is None
+    assert extract_json_block('{"a": 1}') is None
+    assert extract_json_block("```json\n没有JSON\n```") is None
+
+# 与上面代码块提取用例相同的JSON文本
+SCANNER_CASES = [
+    '{"a": {"b": {"c": [1, 2]}}, "d": {}}',
+    '{"steps": "点击{按钮}后[确认]", "expected": "}"}',
+    '{"a": "他说\\"}\\"", "b": "C:\\\\", "c": 1}',
+    '[{"a": 1}, {"b": [2, "]"]}]',
+]
+
+@pytest.mark.parametrize("block", SCANNER_CASES)
+def test_json_boundary_scanner(block):
+    """测试整段和逐字符输入时找到相同的结束位置"""
+    text = block + " 之后的文本}"
+    assert JsonBoundaryScanner().feed(text) == len(block) - 1
+    
+    # 逐字符输入，转义符和括号都落在分段边界上
+    scanner = JsonBoundaryScanner()
+    ends = [scanner.feed(char) for char in text]
+    assert ends.index(0) == len(block) - 1
+
+def test_json_boundary_scanner_unterminated():
+    """测试未闭合时返回-1并保留嵌套深度"""
+    scanner = JsonBoundaryScanner()
+    assert scanner.feed('{"a": {"b": 1}') == -1
+    assert scanner.depth == 1
+    assert scanner.feed("}") == 0
+
+def _fake_stream(chunks):
+    """构造按给定分片返回内容的流式请求"""
+    async def chat_stream(messages, response_format=None, timeout=None, config=None):
+        for chunk in chunks:
+            yield chunk
+    return chat_stream
+
+@pytest.mark.asyncio
+async def test_chat_stream_json_chunks(monkeypatch):
+    """测试流式JSON从对象起始处输出，对象闭合后立即结束"""
+    ai = get_zhipu_ai()
+    monkeypatch.setattr(ai, "chat_stream", _fake_stream([
+        "好的：",
+        '{"testcases": [{"name": "括号}', '{测试", "steps": "输入\\"',
+        '}\\""}], "meta": {"n": 1}}',
+        "以上为全部内容",
+    ]))
+
+    chunks = [chunk async for chunk in ai.chat_stream_json_chunks([{"role": "user", "content": "生成"}])]
+    assert orjson.loads("".join(chunks)) == {
+        "testcases": [{"name": "括号}{测试", "steps": '输入"}"'}],
+        "meta": {"n": 1}
+    }
+
+@pytest.mark.asyncio
+async def test_chat_stream_json_chunks_truncated(monkeypatch):
+    """测试对象未闭合时抛出截断异常"""
+    ai = get_zhipu_ai()
+    monkeypatch.setattr(ai, "chat_stream", _fake_stream(['{"testcases": [{"name": ', '"未完']))
+
+    with pytest.raises(TruncatedResponseError):
+        async for _ in ai.chat_stream_json_chunks([{"role": "user", "content": "生成"}]):
+            pass
+
+    # 非流式接口返回None
+    assert await ai.chat_stream_json([{"role": "user", "content": "生成"}]) is None
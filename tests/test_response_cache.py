@@ -0,0 +1,52 @@
+from src.ai_core.response_cache import ResponseCache, file_fingerprints
+
+def test_response_cache():
+    """测试响应缓存功能"""
+    cache = ResponseCache(maxsize=2, ttl=60)
+    messages = [
+        {"role": "system", "content": "你是测试专家"},
+        {"role": "user", "content": "生成测试用例"}
+    ]
+    
+    # 相同输入生成相同的键
+    key = cache.make_key(messages, response_format={"type": "json_object"})
+    assert key == cache.make_key(
+        [dict(msg) for msg in messages],
+        response_format={"type": "json_object"}
+    )
+    
+    # 消息中的易变元数据不影响缓存键
+    assert key == cache.make_key(
+        [{**msg, "id": f"msg-{i}", "additional_kwargs": {}} for i, msg in enumerate(messages)],
+        response_format={"type": "json_object"}
+    )
+    
+    # 不同参数生成不同的键
+    assert key != cache.make_key(messages, response_format={"type": "text"})
+    
+    # 读写缓存
+    assert cache.get(key) is None
+    cache.set(key, '{"testcases": []}')
+    assert cache.get(key) == '{"testcases": []}'
+    
+    # 超出容量时淘汰最早的条目
+    cache.set("k2", "v2")
+    cache.set("k3", "v3")
+    assert cache.get(key) is None
+    
+    # 清空缓存
+    cache.clear()
+    assert cache.get("k3") is None
+
+def test_file_fingerprints(tmp_path):
+    """测试文件指纹随文件内容变化"""
+    image = tmp_path / "image.png"
+    image.write_bytes(b"a")
+    before = file_fingerprints([str(image)])
+    
+    image.write_bytes(b"ab")
+    assert file_fingerprints([str(image)]) != before
+    
+    # 不存在的文件只保留路径
+    missing = str(tmp_path / "missing.png")
+    assert file_fingerprints([missing]) == [missing]
@@ -0,0 +1,31 @@
+from src.ai_core.semantic_cache import SemanticCache
+
+def test_semantic_cache():
+    """测试语义缓存功能"""
+    cache = SemanticCache(threshold=0.95, max_entries_per_context=2)
+    context = cache.make_context_key([{"role": "user", "content": "你好"}])
+
+    # 未写入时不命中
+    assert cache.get(context, [1.0, 0.0]) is None
+
+    cache.set(context, [1.0, 0.0], "回复A")
+
+    # 方向相近的向量命中，与向量长度无关
+    assert cache.get(context, [2.0, 0.1]) == "回复A"
+
+    # 相似度低于阈值不命中
+    assert cache.get(context, [1.0, 1.0]) is None
+
+    # 上下文不同不命中
+    other = cache.make_context_key([{"role": "user", "content": "再见"}])
+    assert cache.get(other, [1.0, 0.0]) is None
+
+    # 超出分区容量时淘汰最早的条目
+    cache.set(context, [0.0, 1.0], "回复B")
+    cache.set(context, [-1.0, 0.0], "回复C")
+    assert cache.get(context, [1.0, 0.0]) is None
+    assert cache.get(context, [0.0, 1.0]) == "回复B"
+
+    # 清空缓存
+    cache.clear()
+    assert cache.get(context, [0.0, 1.0]) is None